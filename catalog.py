@@ -0,0 +1,466 @@
+"""Per-recording JSON manifests and a SQLite catalog of the recordings directory.
+
+Every recording_<timestamp>/ folder gets a manifest.json describing its files, stats,
+checksums, encoder settings and transcript status. The catalog (catalog.db in the
+recordings directory) indexes the manifests so listing and filtering doesn't have to
+walk the tree. Transcripts go into a full-text index with word timings, so a search
+returns the recording and the second the words were spoken:
+
+    python catalog.py recordings --status failed
+    python catalog.py recordings --since 20250701 --rescan
+    python catalog.py recordings --search "calibration" --play
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import threading
+import wave
+from contextlib import closing
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+CATALOG_NAME = "catalog.db"
+FOLDER_PREFIX = "recording_"
+INSERT_ROW = "INSERT OR REPLACE INTO recordings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+CHUNK_WORDS = 12  # Words per full-text row; each row keeps the start time of every word
+
+manifest_lock = threading.Lock()  # Transcription and background encode threads update manifests too
+
+def read_manifest(folder):
+    """Load a recording's manifest, or None if it has none"""
+    try:
+        with open(os.path.join(folder, MANIFEST_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def write_manifest(folder, manifest):
+    """Replace the manifest atomically so readers never see a half-written file"""
+    path = os.path.join(folder, MANIFEST_NAME)
+    temp_path = path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+def merge(target, changes):
+    for key, value in changes.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            merge(target[key], value)
+        else:
+            target[key] = value
+    return target
+
+def file_checksum(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def media_checksum(folder, section):
+    """SHA-256 of a manifest section's file, reusing the recorded one while the file's size and
+    mtime are unchanged. Returns the checksum and the manifest changes that cache it."""
+    stat = os.stat(os.path.join(folder, section['file']))
+    signature = [stat.st_size, stat.st_mtime_ns]
+    if section.get('sha256') and section.get('sha256_stat') == signature:
+        return section['sha256'], {}
+    checksum = file_checksum(os.path.join(folder, section['file']))
+    return checksum, {'sha256': checksum, 'sha256_stat': signature}
+
+def write_transcript(folder, text, words=None):
+    """Save transcript_<timestamp>.txt, plus its word timings as .json for search; returns the .txt name"""
+    name = f"transcript_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+    with open(os.path.join(folder, name), 'w', encoding='utf-8') as f:
+        f.write(text)
+    if words:
+        with open(os.path.join(folder, os.path.splitext(name)[0] + ".json"), 'w', encoding='utf-8') as f:
+            json.dump({'transcription': text, 'words': words}, f, ensure_ascii=False)
+    return name
+
+def transcript_source(folder, transcript_file):
+    """Word-timed transcript_<ts>.json if there is one, else the plain transcript_<ts>.txt"""
+    if not transcript_file:
+        return None
+    words_path = os.path.join(folder, os.path.splitext(transcript_file)[0] + ".json")
+    if os.path.exists(words_path):
+        return words_path
+    text_path = os.path.join(folder, transcript_file)
+    return text_path if os.path.exists(text_path) else None
+
+def transcript_chunks(source):
+    """Split a transcript into (text, start, word start times) rows for the full-text index"""
+    with open(source, encoding='utf-8') as f:
+        if source.endswith(".json"):
+            words = [(w['word'], w['start']) for w in json.load(f).get('words', [])]
+        else:
+            words = [(word, None) for word in f.read().split()]
+    for i in range(0, len(words), CHUNK_WORDS):
+        chunk = words[i:i + CHUNK_WORDS]
+        times = " ".join("" if start is None else f"{start:.2f}" for _, start in chunk).strip()
+        yield " ".join(word for word, _ in chunk), chunk[0][1], times
+
+def match_expression(query):
+    """Quote each search term so user input can't break FTS5 syntax; a trailing * keeps prefix search"""
+    terms = []
+    for term in query.split():
+        prefix = term.endswith('*')
+        term = term.rstrip('*').replace('"', '""')
+        if term:
+            terms.append(f'"{term}"*' if prefix else f'"{term}"')
+    return " ".join(terms)
+
+def word_time(text, times, query):
+    """Start time of the first word in a chunk that matches a search term"""
+    starts = times.split()
+    if not starts:
+        return None
+    terms = [term.rstrip('*').lower() for term in query.split()]
+    for word, start in zip(text.split(), starts):
+        if any(word.lower().startswith(term) for term in terms if term):
+            return float(start)
+    return float(starts[0])
+
+def play_at(path, seconds, preroll=1.0):
+    """Open a recording at a position: ffplay seeks, other players open at the start"""
+    position = max(0.0, (seconds or 0.0) - preroll)
+    if shutil.which('ffplay'):
+        return subprocess.Popen(['ffplay', '-autoexit', '-ss', f"{position:.2f}", path],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if os.name == 'nt':
+        os.startfile(path)
+    else:
+        subprocess.Popen(['open' if sys.platform == 'darwin' else 'xdg-open', path])
+    return None
+
+def folder_size(folder):
+    total = 0
+    for root, _, files in os.walk(folder):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+def folder_created(folder):
+    """Creation time from the recording_YYYYMMDD_HHMMSS folder name, else the folder's mtime"""
+    try:
+        stamp = os.path.basename(os.path.normpath(folder))[len(FOLDER_PREFIX):]
+        return datetime.strptime(stamp, "%Y%m%d_%H%M%S").isoformat()
+    except ValueError:
+        return datetime.fromtimestamp(os.path.getmtime(folder)).isoformat(timespec='seconds')
+
+def backfill_manifest(folder):
+    """Build a manifest for a recording made before manifests existed, from its files"""
+    def first_file(subdir, extensions):
+        path = os.path.join(folder, subdir)
+        if not os.path.isdir(path):
+            return None
+        names = sorted(name for name in os.listdir(path) if name.lower().endswith(extensions))
+        return os.path.join(subdir, names[0]) if names else None
+
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'id': os.path.basename(os.path.normpath(folder)),
+        'created': folder_created(folder),
+        'backfilled': True,
+    }
+
+    audio_file = first_file('audio', ('.wav',))
+    if audio_file:
+        manifest['audio'] = {'file': audio_file}
+        try:
+            with wave.open(os.path.join(folder, audio_file), 'rb') as wav:
+                manifest['audio'].update(samples=wav.getnframes(), sample_rate=wav.getframerate(),
+                                         duration=wav.getnframes() / wav.getframerate())
+        except (wave.Error, EOFError) as e:
+            logger.warning(f"Unreadable audio in {folder}: {e}")
+
+    video_file = first_file('video', ('.avi', '.mkv'))
+    if video_file:
+        manifest['video'] = {'file': video_file}
+    final_file = first_file('final', ('.mp4', '.mkv'))
+    if final_file:
+        manifest['final'] = {'file': final_file}
+
+    transcripts = sorted(name for name in os.listdir(folder) if name.startswith('transcript_'))
+    if transcripts:
+        manifest['transcription'] = {'status': 'done', 'file': transcripts[-1]}
+    else:
+        manifest['transcription'] = {'status': 'none'}
+    return manifest
+
+class RecordingCatalog:
+    """SQLite index of the manifests in one recordings directory"""
+
+    def __init__(self, base_dir):
+        self.base_dir = base_dir
+        self.db_path = os.path.join(base_dir, CATALOG_NAME)
+        os.makedirs(base_dir, exist_ok=True)
+        with closing(self.connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS recordings (
+                id TEXT PRIMARY KEY,
+                created TEXT NOT NULL,
+                audio_duration REAL,
+                video_duration REAL,
+                video_frames INTEGER,
+                frames_skipped INTEGER,
+                final_file TEXT,
+                encode_profile TEXT,
+                transcription_status TEXT,
+                transcript_file TEXT,
+                size_bytes INTEGER,
+                manifest_mtime REAL NOT NULL
+            )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS recordings_created ON recordings (created)")
+            conn.execute("CREATE INDEX IF NOT EXISTS recordings_status "
+                         "ON recordings (transcription_status, created)")
+            conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS transcript_fts "
+                         "USING fts5(text, recording_id UNINDEXED, start UNINDEXED, times UNINDEXED)")
+            conn.execute("CREATE TABLE IF NOT EXISTS transcript_sources (recording_id TEXT PRIMARY KEY, "
+                         "source_mtime REAL NOT NULL)")
+            # FTS5 can't index recording_id, so this finds a recording's rows without a scan
+            new_rows_table = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'transcript_rows'").fetchone() is None
+            conn.execute("CREATE TABLE IF NOT EXISTS transcript_rows "
+                         "(rowid INTEGER PRIMARY KEY, recording_id TEXT NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS transcript_rows_recording ON transcript_rows (recording_id)")
+            if new_rows_table:
+                # Catalogs from before the table kept rowid ranges instead
+                conn.execute("INSERT OR IGNORE INTO transcript_rows "
+                             "SELECT rowid, recording_id FROM transcript_fts")
+
+    def connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def save(self, folder, manifest):
+        """Write a recording's manifest and index it"""
+        with manifest_lock:
+            write_manifest(folder, manifest)
+            self.index(folder, manifest)
+
+    def update(self, folder, changes):
+        """Merge changes into a recording's manifest (nested sections are merged) and re-index it"""
+        with manifest_lock:
+            manifest = read_manifest(folder) or backfill_manifest(folder)
+            merge(manifest, changes)
+            write_manifest(folder, manifest)
+            self.index(folder, manifest)
+        return manifest
+
+    def add_checksums(self, folder):
+        """Hash the recording's media files into its manifest; slow for long recordings, so run in the background"""
+        manifest = read_manifest(folder) or {}
+        changes = {}
+        for section in ('audio', 'video', 'final'):
+            relative = manifest.get(section, {}).get('file')
+            if relative and os.path.exists(os.path.join(folder, relative)):
+                changes[section] = media_checksum(folder, {'file': relative})[1]
+        if changes:
+            self.update(folder, changes)
+
+    def index(self, folder, manifest):
+        row = self.row(folder, manifest)
+        with closing(self.connect()) as conn, conn:
+            # Take the write lock before reading, so the app and reprocess.py workers can't interleave
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(INSERT_ROW, row)
+            indexed = conn.execute("SELECT source_mtime FROM transcript_sources WHERE recording_id = ?",
+                                   (row[0],)).fetchone()
+            self.index_transcript(conn, folder, row[0], row[9], indexed[0] if indexed else None)
+            
+    def index_transcript(self, conn, folder, recording_id, transcript_file, indexed_mtime):
+        """(Re)index a recording's transcript if it changed since it was last indexed"""
+        source = transcript_source(folder, transcript_file)
+        mtime = os.path.getmtime(source) if source else None
+        if mtime == indexed_mtime:
+            return False
+        if indexed_mtime is not None:
+            self.drop_transcripts(conn, [recording_id])
+        if source:
+            for text, start, times in transcript_chunks(source):
+                rowid = conn.execute("INSERT INTO transcript_fts (text, recording_id, start, times) "
+                                     "VALUES (?, ?, ?, ?)", (text, recording_id, start, times)).lastrowid
+                conn.execute("INSERT INTO transcript_rows VALUES (?, ?)", (rowid, recording_id))
+            conn.execute("INSERT INTO transcript_sources (recording_id, source_mtime) VALUES (?, ?)",
+                         (recording_id, mtime))
+        return True
+
+    def drop_transcripts(self, conn, recording_ids):
+        for recording_id in recording_ids:
+            conn.execute("DELETE FROM transcript_fts WHERE rowid IN "
+                         "(SELECT rowid FROM transcript_rows WHERE recording_id = ?)", (recording_id,))
+            conn.execute("DELETE FROM transcript_rows WHERE recording_id = ?", (recording_id,))
+            conn.execute("DELETE FROM transcript_sources WHERE recording_id = ?", (recording_id,))
+
+    def row(self, folder, manifest):
+        audio = manifest.get('audio', {})
+        video = manifest.get('video', {})
+        final = manifest.get('final', {})
+        transcription = manifest.get('transcription', {})
+        return (
+            manifest.get('id') or os.path.basename(os.path.normpath(folder)),
+            manifest.get('created') or folder_created(folder),
+            audio.get('duration'), video.get('duration'), video.get('frames'), video.get('frames_skipped'),
+            final.get('file'), final.get('profile'),
+            transcription.get('status'), transcription.get('file'),
+            folder_size(folder),
+            os.path.getmtime(os.path.join(folder, MANIFEST_NAME)),
+        )
+
+    def sync(self):
+        """Bring the catalog up to date with the directory: index new or changed manifests, backfill
+        manifests for older recordings and drop deleted ones. Unchanged recordings cost one stat."""
+        with closing(self.connect()) as conn:
+            known = dict(conn.execute("SELECT id, manifest_mtime FROM recordings").fetchall())
+
+        seen = set()
+        rows = []
+        for entry in os.scandir(self.base_dir):
+            if not entry.is_dir() or not entry.name.startswith(FOLDER_PREFIX):
+                continue
+            seen.add(entry.name)
+            try:
+                mtime = os.path.getmtime(os.path.join(entry.path, MANIFEST_NAME))
+            except FileNotFoundError:
+                mtime = None
+            if mtime is not None and known.get(entry.name) == mtime:
+                continue
+
+            try:
+                with manifest_lock:
+                    manifest = read_manifest(entry.path) if mtime is not None else None
+                    if manifest is None:
+                        manifest = backfill_manifest(entry.path)
+                        write_manifest(entry.path, manifest)
+                    rows.append(self.row(entry.path, manifest))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not catalog {entry.path}: {e}")
+
+        # One transaction for the whole batch; a commit per recording is what makes a first scan slow
+        removed = [(name,) for name in known if name not in seen]
+        with closing(self.connect()) as conn, conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(INSERT_ROW, rows)
+            conn.executemany("DELETE FROM recordings WHERE id = ?", removed)
+            self.drop_transcripts(conn, [name for (name,) in removed])
+            
+            # Transcripts can change without the manifest (e.g. re-transcribed by hand): one stat each
+            indexed = dict(conn.execute("SELECT recording_id, source_mtime FROM transcript_sources").fetchall())
+            for recording_id, transcript_file in conn.execute(
+                    "SELECT id, transcript_file FROM recordings WHERE transcript_file IS NOT NULL").fetchall():
+                try:
+                    self.index_transcript(conn, os.path.join(self.base_dir, recording_id), recording_id,
+                                          transcript_file, indexed.get(recording_id))
+                except (OSError, ValueError, KeyError) as e:
+                    logger.warning(f"Could not index transcript of {recording_id}: {e}")
+        return len(rows), len(removed)
+
+    def search(self, query, limit=20):
+        """Best transcript matches: recording, the second the matching word was spoken, a snippet
+        and the file to play"""
+        expression = match_expression(query)
+        if not expression:
+            return []
+        with closing(self.connect()) as conn:
+            rows = conn.execute(
+                "SELECT f.recording_id, f.start, f.times, f.text, r.final_file, "
+                "snippet(transcript_fts, 0, '[', ']', '...', 10) AS snippet "
+                "FROM transcript_fts f LEFT JOIN recordings r ON r.id = f.recording_id "
+                "WHERE transcript_fts MATCH ? ORDER BY rank LIMIT ?", (expression, limit)).fetchall()
+        hits = []
+        for row in rows:
+            folder = os.path.join(self.base_dir, row['recording_id'])
+            time = word_time(row['text'], row['times'], query)
+            hits.append({
+                'recording_id': row['recording_id'],
+                'time': time if time is not None else row['start'],
+                'snippet': row['snippet'],
+                'file': os.path.join(folder, row['final_file']) if row['final_file'] else None,
+            })
+        return hits
+
+    def query(self, status=None, since=None, until=None, limit=100):
+        """Newest recordings first, optionally filtered by transcript status and creation date range"""
+        clauses, params = [], []
+        if status:
+            clauses.append("transcription_status = ?")
+            params.append(status)
+        if since:
+            clauses.append("created >= ?")
+            params.append(since)
+        if until:
+            clauses.append("created < ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with closing(self.connect()) as conn:
+            return [dict(row) for row in conn.execute(
+                f"SELECT * FROM recordings {where} ORDER BY created DESC LIMIT ?", params + [limit])]
+
+    def status_counts(self):
+        with closing(self.connect()) as conn:
+            return dict(conn.execute(
+                "SELECT transcription_status, COUNT(*) FROM recordings GROUP BY transcription_status").fetchall())
+
+def format_time(seconds):
+    if seconds is None:
+        return "-"
+    return f"{int(seconds // 60):02d}:{seconds % 60:05.2f}"
+
+def parse_date(value):
+    """Accept YYYYMMDD or any ISO date/datetime and return it in the catalog's ISO format"""
+    for fmt in ("%Y%m%d", "%Y%m%d_%H%M%S"):
+        try:
+            return datetime.strptime(value, fmt).isoformat()
+        except ValueError:
+            pass
+    return datetime.fromisoformat(value).isoformat()
+
+def main():
+    parser = argparse.ArgumentParser(description="List and filter recordings from the catalog")
+    parser.add_argument('recordings_dir', nargs='?', default='recordings')
+    parser.add_argument('--status', help="transcription status: pending, done, failed, disabled, none")
+    parser.add_argument('--since', type=parse_date, help="created on or after (YYYYMMDD or ISO)")
+    parser.add_argument('--until', type=parse_date, help="created before (YYYYMMDD or ISO)")
+    parser.add_argument('--limit', type=int, default=100)
+    parser.add_argument('--rescan', action='store_true', help="sync the catalog with the directory first")
+    parser.add_argument('--search', help="search transcripts (end a word with * for prefix matches)")
+    parser.add_argument('--play', action='store_true', help="with --search, play the best hit at the spoken word")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    catalog = RecordingCatalog(args.recordings_dir)
+    if args.rescan:
+        updated, removed = catalog.sync()
+        print(f"Catalog synced: {updated} updated, {removed} removed")
+
+    if args.search:
+        hits = catalog.search(args.search, args.limit)
+        for hit in hits:
+            position = format_time(hit['time'])
+            print(f"{hit['recording_id']}  {position:>8}  {hit['snippet']}")
+        if args.play and hits and hits[0]['file']:
+            process = play_at(hits[0]['file'], hits[0]['time'])
+            if process:
+                process.wait()
+        return
+
+    for row in catalog.query(args.status, args.since, args.until, args.limit):
+        duration = f"{row['audio_duration']:.1f}s" if row['audio_duration'] is not None else "-"
+        print(f"{row['id']}  {duration:>8}  {row['transcription_status'] or '-':<9}  {row['final_file'] or '-'}")
+    print(f"Totals by transcription status: {catalog.status_counts()}")
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,8 @@ const char* ssid     = "Saleh";
 const char* password = "saleh100";
 
 WebServer server(80);
+// Control runs on its own port: the stream handler never returns while a client watches
+WebServer controlServer(81);
 
 // Pin definition for CAMERA_MODEL_AI_THINKER
 #define PWDN_GPIO_NUM     32
@@ -26,6 +28,62 @@ WebServer server(80);
 #define HREF_GPIO_NUM     23
 #define PCLK_GPIO_NUM     22
 
+// Frame sizes the recorder may switch between (frame buffers are allocated for VGA)
+struct FramesizeName {
+  const char* name;
+  framesize_t size;
+};
+const FramesizeName FRAMESIZES[] = {
+  {"QQVGA", FRAMESIZE_QQVGA},
+  {"QVGA",  FRAMESIZE_QVGA},
+  {"CIF",   FRAMESIZE_CIF},
+  {"VGA",   FRAMESIZE_VGA},
+};
+const int FRAMESIZE_COUNT = sizeof(FRAMESIZES) / sizeof(FRAMESIZES[0]);
+
+void sendCameraStatus() {
+  sensor_t * s = esp_camera_sensor_get();
+  const char* name = "OTHER";
+  for (int i = 0; i < FRAMESIZE_COUNT; i++) {
+    if (FRAMESIZES[i].size == s->status.framesize) name = FRAMESIZES[i].name;
+  }
+  String json = "{\"framesize\":\"" + String(name) + "\",\"quality\":" + String(s->status.quality) + "}";
+  controlServer.sendHeader("Access-Control-Allow-Origin", "*");
+  controlServer.send(200, "application/json", json);
+}
+
+// GET /control?framesize=VGA&quality=12 - either argument may be omitted. Both are validated
+// before either is applied, so a rejected request leaves the sensor as it was.
+void handleControl() {
+  sensor_t * s = esp_camera_sensor_get();
+  
+  int index = -1;
+  if (controlServer.hasArg("framesize")) {
+    String name = controlServer.arg("framesize");
+    for (int i = 0; i < FRAMESIZE_COUNT; i++) {
+      if (name.equalsIgnoreCase(FRAMESIZES[i].name)) index = i;
+    }
+    if (index < 0) {
+      controlServer.send(400, "text/plain", "Unknown framesize");
+      return;
+    }
+  }
+  
+  int quality = -1;
+  if (controlServer.hasArg("quality")) {
+    quality = controlServer.arg("quality").toInt();
+    if (quality < 4 || quality > 63) {
+      controlServer.send(400, "text/plain", "quality must be 4-63");
+      return;
+    }
+  }
+  
+  if (index >= 0) s->set_framesize(s, FRAMESIZES[index].size);
+  if (quality >= 0) s->set_quality(s, quality);
+  
+  sendCameraStatus();
+}
+
 void handleStream() {
   WiFiClient client = server.client();
   String response = 
@@ -44,6 +102,8 @@ void handleStream() {
     client.write(fb->buf, fb->len);
     server.sendContent("\r\n");
     esp_camera_fb_return(fb);
+    // keep answering control requests while streaming
+    controlServer.handleClient();
     // allow client to abort
     if (!client.connected()) break;
   }
@@ -111,9 +171,14 @@ void setup(){
   server.on("/stream", HTTP_GET, handleStream);
   server.begin();
   
+  controlServer.on("/control", HTTP_GET, handleControl);
+  controlServer.on("/status", HTTP_GET, sendCameraStatus);
+  controlServer.begin();
+  
   Serial.println("HTTP server started");
 }
 
 void loop(){
   server.handleClient();
+  controlServer.handleClient();
 }
\ No newline at end of file
@@ -0,0 +1,145 @@
+"""Simulated ESP32-CAM for testing the recorder without hardware.
+
+Serves the same endpoints as esp32-cam.ino: an MJPEG stream at /stream and the
+/control and /status endpoints on the control port. A bandwidth limit emulates a
+congested WiFi link, so adaptive quality can be exercised locally:
+
+    python esp32-cam/simulate_camera.py --bandwidth 300
+    CAMERA_CONTROL_PORT=8181 python record.py   # ESP32-CAM IP: 127.0.0.1:8080
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import cv2
+import numpy as np
+
+FRAMESIZES = {"QQVGA": (160, 120), "QVGA": (320, 240), "CIF": (400, 296), "VGA": (640, 480)}
+
+class SimulatedCamera:
+    """Sensor state shared by the stream and control servers"""
+
+    def __init__(self, max_fps, bandwidth_kbps):
+        self.framesize = "VGA"
+        self.quality = 12
+        self.max_fps = max_fps
+        self.bytes_per_second = bandwidth_kbps * 1024 if bandwidth_kbps else None
+        self.lock = threading.Lock()
+        self.frame_index = 0
+
+    def capture(self):
+        """Render a synthetic scene at the current frame size and encode it like the sensor would"""
+        with self.lock:
+            width, height = FRAMESIZES[self.framesize]
+            # Sensor quality is 0-63 (lower is better); map it onto OpenCV's 0-100 scale
+            jpeg_quality = max(5, 100 - int(self.quality * 1.5))
+            self.frame_index += 1
+            index = self.frame_index
+
+        x = np.linspace(0, 4 * np.pi, width)
+        y = np.linspace(0, 4 * np.pi, height)[:, None]
+        scene = (np.sin(x + index * 0.1) + np.cos(y - index * 0.05)) * 60 + 128
+        noise = np.random.randint(0, 12, (height, width))
+        gray = np.clip(scene + noise, 0, 255).astype(np.uint8)
+        frame = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+        cv2.putText(frame, f"{index} {self.framesize} q{self.quality}", (10, 30),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
+        ok, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+        return jpeg.tobytes()
+
+    def status(self):
+        return {"framesize": self.framesize, "quality": self.quality}
+
+class StreamHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if urlparse(self.path).path != '/stream':
+            self.send_error(404)
+            return
+        camera = self.server.camera
+        self.send_response(200)
+        self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=frame')
+        self.end_headers()
+
+        try:
+            while True:
+                started = time.time()
+                jpeg = camera.capture()
+                self.wfile.write(b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n" % len(jpeg))
+                self.wfile.write(jpeg)
+                self.wfile.write(b"\r\n")
+
+                # Whichever is slower: the sensor's frame rate or pushing the bytes through the link
+                frame_time = 1.0 / camera.max_fps
+                if camera.bytes_per_second:
+                    frame_time = max(frame_time, len(jpeg) / camera.bytes_per_second)
+                time.sleep(max(0, frame_time - (time.time() - started)))
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+class ControlHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        camera = self.server.camera
+        url = urlparse(self.path)
+        if url.path == '/control':
+            args = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            framesize = args.get('framesize', camera.framesize).upper()
+            if framesize not in FRAMESIZES:
+                self.send_error(400, "Unknown framesize")
+                return
+            quality = int(args.get('quality', camera.quality))
+            if not 4 <= quality <= 63:
+                self.send_error(400, "quality must be 4-63")
+                return
+            with camera.lock:
+                camera.framesize = framesize
+                camera.quality = quality
+            print(f"Control: {framesize} q{quality}")
+        elif url.path != '/status':
+            self.send_error(404)
+            return
+
+        body = json.dumps(camera.status()).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated ESP32-CAM stream and control server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080, help="stream port (firmware: 80)")
+    parser.add_argument('--control-port', type=int, default=8181, help="control port (firmware: 81)")
+    parser.add_argument('--max-fps', type=float, default=25, help="sensor frame rate limit")
+    parser.add_argument('--bandwidth', type=float, default=0, help="link limit in KB/s (0 = unlimited)")
+    args = parser.parse_args()
+
+    camera = SimulatedCamera(args.max_fps, args.bandwidth)
+    servers = []
+    for port, handler in ((args.port, StreamHandler), (args.control_port, ControlHandler)):
+        server = ThreadingHTTPServer((args.host, port), handler)
+        server.daemon_threads = True
+        server.camera = camera
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+
+    print(f"Simulated camera: stream http://{args.host}:{args.port}/stream, "
+          f"control http://{args.host}:{args.control_port}/control")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        for server in servers:
+            server.shutdown()
+
+if __name__ == "__main__":
+    main()
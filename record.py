@@ -1,27 +1,476 @@
+import time
+STARTED = time.perf_counter()  # For reporting time to first window
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 import threading
-import time
-import cv2
-import numpy as np
-import serial
-import serial.tools.list_ports
+import importlib
+import importlib.util
 import wave
 import struct
 import queue
+from collections import deque
 from datetime import datetime
 import os
-from PIL import Image, ImageTk
 import subprocess
 import sys
 import logging
-import requests
+import tempfile
+import socket
 import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from catalog import RecordingCatalog, format_time, play_at, read_manifest, write_transcript
+from reprocess import ENCODE_PROFILES, mux_audio_video
+from retention import RetentionPolicy, disk_space_low, format_size, free_bytes, sweep
+from tracing import now_us, tracer
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+class Deferred:
+    """Stand-in that creates the real object on first attribute access, so the window doesn't
+    wait for heavy imports (cv2, numpy, PIL, requests) it doesn't need yet"""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._target = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._target is None:
+            with self._lock:
+                if self._target is None:
+                    self._target = self._factory()
+        return self._target
+
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
+
+def lazy_module(name):
+    return Deferred(lambda: importlib.import_module(name))
+
+cv2 = lazy_module('cv2')
+np = lazy_module('numpy')
+Image = lazy_module('PIL.Image')
+ImageTk = lazy_module('PIL.ImageTk')
+serial = lazy_module('serial')
+list_ports = lazy_module('serial.tools.list_ports')
+requests = lazy_module('requests')
+timeline = lazy_module('timeline')
+
+def create_http_session():
+    """Pooled HTTP session so API calls reuse connections instead of new handshakes"""
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    # Lets the transcription server share its workers fairly between recording rigs
+    session.headers['X-Client-Id'] = socket.gethostname()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+http_session = Deferred(create_http_session)
+
+class RestreamHandler(BaseHTTPRequestHandler):
+    """Serves the camera's latest JPEG frames to local viewers"""
+    
+    def do_GET(self):
+        restreamer = self.server.restreamer
+        if self.path == '/stream':
+            self.send_stream(restreamer)
+        elif self.path == '/snapshot.jpg':
+            jpeg, _ = restreamer.wait_jpeg(0, timeout=5)
+            if jpeg is None:
+                self.send_error(503, "No frame from camera")
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/jpeg')
+            self.send_header('Content-Length', str(len(jpeg)))
+            self.end_headers()
+            self.wfile.write(jpeg)
+        elif self.path == '/metrics':
+            body = restreamer.render_metrics().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_error(404)
+            
+    def send_stream(self, restreamer):
+        self.send_response(200)
+        self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=frame')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        restreamer.add_viewer(1)
+        try:
+            seq = 0
+            while restreamer.running:
+                # Slow viewers skip to the newest frame instead of falling behind
+                jpeg, seq = restreamer.wait_jpeg(seq, timeout=5)
+                if jpeg is None:
+                    continue
+                self.wfile.write(b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n" % len(jpeg))
+                self.wfile.write(jpeg)
+                self.wfile.write(b"\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            restreamer.add_viewer(-1)
+            
+    def log_message(self, format, *args):
+        logger.debug(f"Restream: {format % args}")
+
+class CameraRestreamer:
+    """Pulls the ESP32-CAM MJPEG stream once and fans the JPEG frames out, unchanged,
+    to local HTTP viewers. Also stands in for cv2.VideoCapture for preview and recording."""
+    
+    def __init__(self, source_url, host, port, session=None):
+        self.source_url = source_url
+        self.host = host
+        self.port = port
+        self.http = session or http_session
+        self.running = False
+        self.response = None
+        self.server = None
+        
+        self.frame_ready = threading.Condition()
+        self.jpeg = None
+        self.seq = 0
+        self.last_read_seq = 0
+        
+        self.viewers = 0
+        self.frames_received = 0
+        self.bytes_received = 0
+        self.arrivals = deque(maxlen=1000)  # (arrival time, JPEG bytes) of recent frames
+        
+    def start(self):
+        """Connect to the camera and start relaying; returns False if the camera is unreachable"""
+        try:
+            self.response = self.open_source()
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Cannot open camera stream: {e}")
+            return False
+            
+        self.running = True
+        threading.Thread(target=self.reader_worker, daemon=True).start()
+        
+        try:
+            self.server = ThreadingHTTPServer((self.host, self.port), RestreamHandler)
+            self.server.daemon_threads = True
+            self.server.restreamer = self
+            threading.Thread(target=self.server.serve_forever, daemon=True).start()
+            logger.info(f"Restreaming camera at {self.url}")
+        except OSError as e:
+            # Capture still works without the fan-out server
+            logger.warning(f"Restream server unavailable on port {self.port}: {e}")
+            self.server = None
+        return True
+        
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/stream"
+        
+    def open_source(self):
+        response = self.http.get(self.source_url, stream=True, timeout=(5, 10))
+        response.raise_for_status()
+        return response
+        
+    def reader_worker(self):
+        """Read multipart JPEG parts from the camera, reconnecting if the link drops"""
+        while self.running:
+            try:
+                if self.response is None:
+                    self.response = self.open_source()
+                self.read_parts(self.response.raw)
+            except (requests.exceptions.RequestException, OSError, ValueError) as e:
+                if self.running:
+                    logger.warning(f"Camera stream interrupted, reconnecting: {e}")
+                    time.sleep(1)
+            finally:
+                if self.response is not None:
+                    self.response.close()
+                    self.response = None
+                    
+    def read_parts(self, stream):
+        length = None
+        while self.running:
+            line = stream.readline()
+            if not line:
+                raise ConnectionError("Camera closed the stream")
+            if line.lower().startswith(b"content-length:"):
+                length = int(line.split(b":", 1)[1])
+            elif not line.strip() and length:
+                with tracer.span("camera receive", bytes=length):
+                    jpeg = stream.read(length)
+                if len(jpeg) < length:
+                    raise ConnectionError("Camera closed the stream mid-frame")
+                self.publish(jpeg)
+                length = None
+                
+    def publish(self, jpeg):
+        with self.frame_ready:
+            self.jpeg = jpeg
+            self.seq += 1
+            self.frames_received += 1
+            self.bytes_received += len(jpeg)
+            self.arrivals.append((time.time(), len(jpeg)))
+            self.frame_ready.notify_all()
+            
+    def wait_jpeg(self, after_seq, timeout=None):
+        """Wait for a frame newer than after_seq; returns (jpeg, seq) or (None, after_seq)"""
+        with self.frame_ready:
+            if not self.frame_ready.wait_for(lambda: self.seq > after_seq or not self.running, timeout):
+                return None, after_seq
+            if self.seq <= after_seq:
+                return None, after_seq
+            return self.jpeg, self.seq
+            
+    def link_stats(self, since):
+        """Frame rate and byte rate of frames that arrived since the given time"""
+        now = time.time()
+        if now <= since:
+            return None
+        with self.frame_ready:
+            sizes = [size for arrived, size in self.arrivals if arrived >= since]
+        return len(sizes) / (now - since), sum(sizes) / (now - since)
+        
+    def add_viewer(self, delta):
+        with self.frame_ready:
+            self.viewers += delta
+            
+    def render_metrics(self):
+        return (
+            "# TYPE camera_viewers gauge\n"
+            f"camera_viewers {self.viewers}\n"
+            "# TYPE camera_frames_received_total counter\n"
+            f"camera_frames_received_total {self.frames_received}\n"
+            "# TYPE camera_bytes_received_total counter\n"
+            f"camera_bytes_received_total {self.bytes_received}\n"
+        )
+        
+    # cv2.VideoCapture interface used by preview and recording
+    def isOpened(self):
+        return self.running
+        
+    def read(self, timeout=2):
+        """Decode the next frame not yet returned to a reader, like VideoCapture.read"""
+        with tracer.span("wait frame"):
+            jpeg, seq = self.wait_jpeg(self.last_read_seq, timeout)
+        if jpeg is None:
+            return False, None
+        self.last_read_seq = seq
+        with tracer.span("decode", bytes=len(jpeg)):
+            frame = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+        return frame is not None, frame
+        
+    def release(self):
+        self.running = False
+        with self.frame_ready:
+            self.frame_ready.notify_all()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        if self.response is not None:
+            self.response.close()
+
+class CameraTuner:
+    """Steps the camera's JPEG quality and frame size down when frames arrive too slowly
+    for the target rate, and back up once the measured link throughput leaves headroom."""
+    
+    # (framesize, jpeg_quality) from heaviest to lightest; quality is 4-63, lower is better
+    LADDER = [("VGA", 10), ("VGA", 12), ("VGA", 16), ("VGA", 22),
+              ("CIF", 16), ("CIF", 22), ("QVGA", 16), ("QVGA", 22), ("QQVGA", 22)]
+    START_STEP = 1          # Firmware default: VGA, quality 12
+    INTERVAL = 2.0          # Seconds of frames measured per decision
+    LOW_RATIO = 0.85        # Step down below 85% of the target rate
+    HIGH_RATIO = 0.95       # Count as keeping up at 95%
+    STABLE_WINDOWS = 3      # Windows in a row at target before trying a heavier step
+    HEADROOM = 0.9          # Heavier step must fit in 90% of the last throughput that fell short
+    
+    def __init__(self, restreamer, control_url, target_fps, allow_resize, session=None):
+        self.restreamer = restreamer
+        self.control_url = control_url
+        self.target_fps = target_fps
+        self.allow_resize = allow_resize  # Frame size only changes when this returns True
+        self.http = session or http_session
+        self.running = False
+        self.control_lock = threading.Lock()  # Held for the whole of a /control request
+        
+        self.step = self.START_STEP
+        self.changed_at = time.time()
+        self.stable = 0
+        self.ceiling = None       # Byte rate the link delivered when it last fell short
+        self.camera_limit = None  # Frame rate the camera tops out at regardless of the link
+        self.frame_bytes = {}     # Step -> measured bytes per frame
+        self.step_down_from = None
+        self.fps = 0.0
+        
+    @property
+    def mode(self):
+        framesize, quality = self.LADDER[self.step]
+        return f"{framesize} q{quality}"
+        
+    def start(self):
+        """Start tuning; returns False if the camera firmware has no control endpoint"""
+        try:
+            self.apply(self.step)
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Camera control unavailable, adaptive quality disabled: {e}")
+            return False
+        self.running = True
+        threading.Thread(target=self.tuner_worker, daemon=True).start()
+        return True
+        
+    def stop(self):
+        self.running = False
+        
+    def apply(self, step):
+        """Switch the camera to a ladder step; returns False if it would resize while resizing is not allowed"""
+        framesize, quality = self.LADDER[step]
+        with self.control_lock:
+            # Checked again under the lock: a recording may have started since the step was chosen
+            if framesize != self.LADDER[self.step][0] and not self.allow_resize():
+                return False
+            response = self.http.get(self.control_url, params={'framesize': framesize, 'quality': quality},
+                                     timeout=2)
+            response.raise_for_status()
+            self.step = step
+            self.changed_at = time.time()
+        return True
+        
+    def hold_frame_size(self):
+        """Wait out a /control request in flight; once allow_resize() returns False, the frame size
+        stays as it is from here on"""
+        with self.control_lock:
+            pass
+        
+    def tuner_worker(self):
+        while self.running:
+            time.sleep(self.INTERVAL)
+            # Only measure frames sent since the last change took effect
+            stats = self.restreamer.link_stats(max(time.time() - self.INTERVAL, self.changed_at))
+            if stats is None or not self.running:
+                continue
+            try:
+                self.adjust(*stats)
+            except requests.exceptions.RequestException as e:
+                logger.warning(f"Camera control request failed: {e}")
+                
+    def next_step(self, direction):
+        """Neighbouring ladder step in the given direction (+1 lighter, -1 heavier), or None"""
+        framesize = self.LADDER[self.step][0]
+        step = self.step + direction
+        while 0 <= step < len(self.LADDER):
+            if self.allow_resize() or self.LADDER[step][0] == framesize:
+                return step
+            step += direction
+        return None
+        
+    def adjust(self, fps, byte_rate):
+        self.fps = fps
+        per_frame = byte_rate / fps if fps > 0 else 0
+        if per_frame:
+            self.frame_bytes[self.step] = per_frame
+        if self.camera_limit and fps > self.camera_limit * 1.1:
+            self.camera_limit = None
+        target = min(self.target_fps, self.camera_limit or self.target_fps)
+        
+        if self.step_down_from is not None:
+            previous_step, previous_fps, previous_byte_rate = self.step_down_from
+            self.step_down_from = None
+            if byte_rate < previous_byte_rate * 0.8 and fps < previous_fps * 1.1:
+                # Less data went through but no more frames: the camera, not the link, sets the pace
+                self.camera_limit = max(previous_fps, 1.0)
+                self.ceiling = None
+                if self.apply(previous_step):
+                    logger.info(f"Camera tops out at {previous_fps:.1f} FPS, back to {self.mode}")
+                return
+                
+        if fps < target * self.LOW_RATIO:
+            self.stable = 0
+            if byte_rate > 0:
+                self.ceiling = byte_rate
+            lighter = self.next_step(1)
+            previous = (self.step, fps, byte_rate)
+            if lighter is not None and self.apply(lighter):
+                self.step_down_from = previous
+                logger.info(f"Camera at {fps:.1f}/{target:.0f} FPS, {byte_rate / 1024:.0f} KB/s: "
+                            f"stepping down to {self.mode}")
+        elif fps >= target * self.HIGH_RATIO:
+            self.stable += 1
+            heavier = self.next_step(-1)
+            if self.stable < self.STABLE_WINDOWS or heavier is None:
+                return
+            predicted = self.frame_bytes.get(heavier, per_frame * 1.3)
+            if self.ceiling is None or predicted * target < self.ceiling * self.HEADROOM:
+                self.stable = 0
+                if self.apply(heavier):
+                    logger.info(f"Camera keeping up at {fps:.1f} FPS: stepping up to {self.mode}")
+            else:
+                # Probe upwards slowly in case the link has improved since it fell short
+                self.ceiling *= 1.02
+        else:
+            self.stable = 0
+
+class LocalTranscriptionStream:
+    """Streams raw PCM blocks to a transcriber on the same machine over its Unix socket.
+    Blocks are decoded while recording, so the transcript is ready right after stop."""
+    
+    def __init__(self, socket_path, sample_rate, sample_width=1, model=None):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(5)
+        self.sock.connect(socket_path)
+        self.sock.settimeout(None)
+        header = {'rate': sample_rate, 'sample_width': sample_width, 'model': model}
+        self.sock.sendall(json.dumps(header).encode('utf-8') + b"\n")
+        
+        self.blocks = queue.Queue()
+        self.failed = False
+        self.sender = threading.Thread(target=self.send_worker, daemon=True)
+        self.sender.start()
+        
+    def send(self, block):
+        """Queue a block; never blocks the caller (the audio capture thread)"""
+        if not self.failed:
+            self.blocks.put(block)
+            
+    def send_worker(self):
+        while True:
+            block = self.blocks.get()
+            if not self.failed:
+                try:
+                    # Length prefix and payload go out separately so the block is not copied
+                    self.sock.sendall(struct.pack(">I", len(block)))
+                    if block:
+                        self.sock.sendall(block)
+                except OSError as e:
+                    logger.error(f"Local transcription stream failed: {e}")
+                    self.failed = True
+            if not block:
+                break
+                
+    def finish(self, timeout=60):
+        """End the stream and wait for the transcription result"""
+        self.blocks.put(b"")
+        self.sender.join()
+        if self.failed:
+            raise ConnectionError("Local transcription stream failed")
+        self.sock.settimeout(timeout)
+        with self.sock.makefile('rb') as reply:
+            line = reply.readline()
+        if not line:
+            raise ConnectionError("Transcriber closed the connection")
+        return json.loads(line)
+        
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
 class AudioVideoRecorder:
     def __init__(self, root):
         self.root = root
@@ -34,14 +483,60 @@ class AudioVideoRecorder:
         self.FRAME_RATE = 20  # More realistic for ESP32-CAM
         self.PREVIEW_FPS = 30  # Higher preview FPS
         
+        # Synchronization tuning (also recorded in each recording's manifest)
+        self.AUDIO_LATENCY_COMPENSATION = 0.03  # 30ms جلوتر از video
+        self.VIDEO_LATENCY_COMPENSATION = 0.05  # 50ms تأخیر شبکه
+        self.MUX_SYNC_OFFSET = 0.02  # 20ms audio delay to match video better
+        
         # API settings
         self.API_URL = "http://localhost:8000/transcribe/"
         self.transcription_enabled = True
+        self.http = http_session
+        self.UPLOAD_CHUNK_SIZE = 1024 * 1024  # Resumable upload chunk size (bytes)
+        self.UPLOAD_RETRIES = 5  # Consecutive failed chunks before giving up
+        # Unix socket of a transcriber on this machine (its LOCAL_SOCKET_PATH), used instead of
+        # HTTP when present; empty = always upload
+        self.LOCAL_SOCKET_PATH = os.getenv("TRANSCRIBER_SOCKET", "")
+        self.local_stream = None
+        
+        # Final encode profiles: container extension and ffmpeg codec arguments (shared with reprocess.py)
+        self.ENCODE_PROFILES = ENCODE_PROFILES
+        # Leave cores for live capture while finalizing; deferred encodes get fewer still
+        self.ENCODE_THREADS = int(os.getenv("ENCODE_THREADS", max(1, (os.cpu_count() or 2) // 2)))
+        self.DEFERRED_ENCODE_THREADS = int(os.getenv("DEFERRED_ENCODE_THREADS", 1))
+        self.encode_queue = queue.Queue()  # High-quality encodes waiting to run in the background
+        
+        # Static-scene decimation: frames nearly identical to the last stored one are dropped
+        self.STATIC_DIFF_THRESHOLD = float(os.getenv("STATIC_DIFF_THRESHOLD", 2.0))  # Mean 64x48 gray diff (0-255)
+        self.MAX_HOLD_SECONDS = float(os.getenv("MAX_HOLD_SECONDS", 2.0))  # Store a frame at least this often
+        self.frames_skipped = 0
+        
+        # Scrubbing timeline built while recording: waveform peaks and thumbnail sprites
+        self.THUMBNAIL_INTERVAL = float(os.getenv("THUMBNAIL_INTERVAL", 1.0))  # Seconds between thumbnails
+        self.peaks = None
+        self.sprites = None
+        
+        # Pipeline tracing (trace.json per recording); per-sample-block spans shorter than this are dropped
+        self.TRACE_BLOCK_THRESHOLD_MS = float(os.getenv("TRACE_BLOCK_THRESHOLD_MS", 1.0))
+        
+        # Storage retention (see retention.py), applied by a background sweeper that waits while recording,
+        # unless free space is below the watermark: then the oldest finished recordings are trimmed at once
+        self.retention = RetentionPolicy.from_env()
+        self.SWEEP_INTERVAL = float(os.getenv("SWEEP_INTERVAL", 3600))  # Seconds between scheduled sweeps
+        self.DISK_CHECK_INTERVAL = 30  # Seconds between free-space checks
+        self.sweep_requested = threading.Event()
         
         # Communication settings
         self.serial_port = None
         self.esp32_ip = ""
         self.stream_url = ""
+        # The camera stream is pulled once and re-served here to any number of local viewers
+        self.RESTREAM_HOST = os.getenv("RESTREAM_HOST", "127.0.0.1")
+        self.RESTREAM_PORT = int(os.getenv("RESTREAM_PORT", 8081))
+        # Firmware control endpoint for frame size / JPEG quality, and the rate to hold
+        self.CAMERA_CONTROL_PORT = int(os.getenv("CAMERA_CONTROL_PORT", 81))
+        self.TARGET_FPS = float(os.getenv("CAMERA_TARGET_FPS", self.FRAME_RATE))
+        self.tuner = None
         
         # Recording state
         self.is_recording = False
@@ -74,6 +569,9 @@ class AudioVideoRecorder:
         
         self.setup_ui()
         self.start_preview_thread()
+        threading.Thread(target=self.deferred_encode_worker, daemon=True).start()
+        threading.Thread(target=self.sync_catalog, daemon=True).start()
+        threading.Thread(target=self.retention_worker, daemon=True).start()
         
     def setup_ui(self):
         # Title
@@ -154,6 +652,13 @@ class AudioVideoRecorder:
         ip_entry = tk.Entry(control_frame, textvariable=self.ip_var, width=30, font=("Arial", 9))
         ip_entry.pack(padx=15, pady=5, fill=tk.X)
         
+        # Adaptive frame size / JPEG quality to hold the frame rate on a congested link
+        self.adaptive_var = tk.BooleanVar(value=True)
+        adaptive_check = tk.Checkbutton(control_frame, text="Adaptive camera quality", 
+                                       variable=self.adaptive_var, fg='white', bg='#34495e',
+                                       font=("Arial", 9), selectcolor='#2c3e50')
+        adaptive_check.pack(anchor='w', padx=15)
+        
         # Test connection button
         test_btn = tk.Button(control_frame, text="Test ESP32-CAM Connection", 
                             command=self.test_esp32_connection, bg='#f39c12', fg='white',
@@ -224,6 +729,13 @@ class AudioVideoRecorder:
                             fg='#2ecc71', bg='#34495e', font=("Arial", 9, "bold"))
         fps_label.pack(anchor='w')
         
+        # Local restream viewers and camera mode
+        self.capture_stats_var = tk.StringVar(value="Restream: off")
+        stats_label = tk.Label(status_frame, textvariable=self.capture_stats_var, 
+                                fg='#95a5a6', bg='#34495e', font=("Arial", 8), justify=tk.LEFT)
+        stats_label.pack(anchor='w')
+        self.last_stats_update = 0
+        
         # Separator
         separator2 = tk.Frame(control_frame, height=2, bg='#7f8c8d')
         separator2.pack(fill=tk.X, padx=15, pady=15)
@@ -241,6 +753,22 @@ class AudioVideoRecorder:
                             font=("Arial", 9), width=35)
         api_entry.pack(padx=15, pady=5, fill=tk.X)
         
+        # Model name (empty = server default)
+        tk.Label(control_frame, text="Model (blank = server default):", 
+                fg='white', bg='#34495e', font=("Arial", 9)).pack(anchor='w', padx=15)
+        self.model_var = tk.StringVar(value="")
+        model_entry = tk.Entry(control_frame, textvariable=self.model_var, 
+                              font=("Arial", 9), width=35)
+        model_entry.pack(padx=15, pady=5, fill=tk.X)
+        
+        # Upload encoding: FLAC is lossless, Opus is speech bitrate
+        tk.Label(control_frame, text="Upload Format:", 
+                fg='white', bg='#34495e', font=("Arial", 9)).pack(anchor='w', padx=15)
+        self.upload_format_var = tk.StringVar(value="flac")
+        format_combo = ttk.Combobox(control_frame, textvariable=self.upload_format_var,
+                                   values=["flac", "opus", "wav"], state="readonly", font=("Arial", 9))
+        format_combo.pack(padx=15, pady=5, fill=tk.X)
+        
         # Transcription enable checkbox
         self.transcription_var = tk.BooleanVar(value=True)
         trans_check = tk.Checkbutton(control_frame, text="Enable Auto-Transcription", 
@@ -285,6 +813,35 @@ class AudioVideoRecorder:
                            bg='#95a5a6', fg='white', font=("Arial", 8), width=8)
         dir_btn.pack(side=tk.RIGHT, padx=(5, 0))
         
+        # Final encode profile
+        tk.Label(control_frame, text="Encode Profile:", 
+                fg='white', bg='#34495e', font=("Arial", 9)).pack(anchor='w', padx=15)
+        self.encode_profile_var = tk.StringVar(value="balanced")
+        profile_combo = ttk.Combobox(control_frame, textvariable=self.encode_profile_var,
+                                    values=list(self.ENCODE_PROFILES), state="readonly", font=("Arial", 9))
+        profile_combo.pack(padx=15, pady=5, fill=tk.X)
+        
+        # Two-tier output: stream-copy proxy right away, selected profile later at low priority
+        self.two_tier_var = tk.BooleanVar(value=False)
+        two_tier_check = tk.Checkbutton(control_frame, text="Quick proxy, encode in background", 
+                                       variable=self.two_tier_var, fg='white', bg='#34495e',
+                                       font=("Arial", 9), selectcolor='#2c3e50')
+        two_tier_check.pack(anchor='w', padx=15, pady=5)
+        
+        # Static frame decimation
+        self.decimate_var = tk.BooleanVar(value=True)
+        decimate_check = tk.Checkbutton(control_frame, text="Skip static frames", 
+                                       variable=self.decimate_var, fg='white', bg='#34495e',
+                                       font=("Arial", 9), selectcolor='#2c3e50')
+        decimate_check.pack(anchor='w', padx=15, pady=5)
+        
+        # Opt-in span tracing of capture and finalize, written as trace.json
+        self.trace_var = tk.BooleanVar(value=os.getenv("RECORDER_TRACE") == "1")
+        trace_check = tk.Checkbutton(control_frame, text="Trace pipeline (trace.json)", 
+                                    variable=self.trace_var, fg='white', bg='#34495e',
+                                    font=("Arial", 9), selectcolor='#2c3e50')
+        trace_check.pack(anchor='w', padx=15, pady=5)
+        
         # Add some padding at the bottom
         bottom_padding = tk.Frame(control_frame, bg='#34495e', height=20)
         bottom_padding.pack(fill=tk.X)
@@ -334,6 +891,120 @@ class AudioVideoRecorder:
                                fg='#bdc3c7', bg='#34495e', font=("Arial", 10))
         status_label.pack(pady=5)
         
+        # Transcript search across all recordings; double-click a hit to play from that word
+        search_frame = tk.Frame(self.transcription_frame, bg='#34495e')
+        search_frame.pack(fill=tk.X, padx=15, pady=(0, 5))
+        
+        self.search_var = tk.StringVar()
+        search_entry = tk.Entry(search_frame, textvariable=self.search_var, font=("Arial", 9))
+        search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        search_entry.bind('<Return>', lambda event: self.search_transcripts())
+        
+        search_btn = tk.Button(search_frame, text="Search Transcripts", command=self.search_transcripts,
+                              bg='#3498db', fg='white', font=("Arial", 8), relief=tk.FLAT)
+        search_btn.pack(side=tk.RIGHT, padx=(5, 0))
+        
+        self.search_results = tk.Listbox(self.transcription_frame, height=5, font=("Arial", 9),
+                                        bg='#ecf0f1', fg='#2c3e50')
+        self.search_results.pack(fill=tk.X, padx=15, pady=(0, 10))
+        self.search_results.bind('<Double-Button-1>', lambda event: self.play_search_hit())
+        self.search_hits = []
+        
+    def search_transcripts(self):
+        """Search every transcript in the output directory and list hits with their times"""
+        query = self.search_var.get().strip()
+        self.search_results.delete(0, tk.END)
+        if not query:
+            return
+        try:
+            self.search_hits = RecordingCatalog(self.output_dir.get()).search(query)
+        except Exception as e:
+            logger.error(f"Transcript search failed: {e}")
+            self.search_hits = []
+            
+        for hit in self.search_hits:
+            self.search_results.insert(tk.END, f"{hit['recording_id']}  {format_time(hit['time'])}  {hit['snippet']}")
+        if not self.search_hits:
+            self.search_results.insert(tk.END, "No matches")
+            
+    def play_search_hit(self):
+        """Open the selected hit's recording at the spoken word"""
+        selection = self.search_results.curselection()
+        if not selection or selection[0] >= len(self.search_hits):
+            return
+        hit = self.search_hits[selection[0]]
+        if not hit['file'] or not os.path.exists(hit['file']):
+            messagebox.showerror("Error", f"No playable file for {hit['recording_id']}")
+            return
+        play_at(hit['file'], hit['time'])
+        
+    def sync_catalog(self):
+        """Catch up the catalog and search index with recordings added or removed outside the app,
+        then resume the high-quality encodes the last session left unfinished"""
+        try:
+            catalog = RecordingCatalog(self.output_dir.get())
+            updated, removed = catalog.sync()
+            logger.info(f"Recording catalog synced: {updated} updated, {removed} removed")
+            self.resume_deferred_encodes(catalog)
+        except Exception as e:
+            logger.error(f"Recording catalog sync failed: {e}")
+            
+    def resume_deferred_encodes(self, catalog):
+        """Queue again every final still marked pending; the encode queue only lives in memory, so
+        these were queued or running when the app last closed"""
+        resumed = 0
+        for row in catalog.query(limit=-1):
+            folder = os.path.join(catalog.base_dir, row['id'])
+            manifest = read_manifest(folder) or {}
+            final = manifest.get('final', {})
+            if not final.get('pending') or not final.get('file'):
+                continue
+            audio, video = manifest.get('audio', {}), manifest.get('video', {})
+            durations = [d for d in (audio.get('duration'), video.get('duration')) if d]
+            # A missing source fails the encode, which marks the final as failed and keeps the proxy
+            self.encode_queue.put((os.path.join(folder, audio.get('file') or ''),
+                                   os.path.join(folder, video.get('file') or ''),
+                                   os.path.join(folder, final['file']), final.get('profile') or "balanced",
+                                   min(durations) if durations else 0))  # 0: no trim
+            resumed += 1
+        if resumed:
+            logger.info(f"Resuming {resumed} unfinished high-quality encodes")
+            
+    def retention_worker(self):
+        """Apply the retention policy every SWEEP_INTERVAL while idle, and right away when disk space runs low"""
+        next_sweep = time.monotonic() + 60  # Let startup and the catalog sync go first
+        warned = False
+        while not self.shutdown_flag.is_set():
+            requested = self.sweep_requested.wait(self.DISK_CHECK_INTERVAL)
+            self.sweep_requested.clear()
+            base_dir = self.output_dir.get()
+            try:
+                if not os.path.isdir(base_dir):
+                    continue
+                urgent = disk_space_low(base_dir, self.retention)
+                warned = warned and urgent
+                due = requested or time.monotonic() >= next_sweep
+                if not urgent and (self.is_recording or not due):
+                    continue
+                
+                def should_stop():
+                    return self.shutdown_flag.is_set() or (self.is_recording and not urgent)
+                
+                for recording_id, actions, freed, error in sweep(RecordingCatalog(base_dir), self.retention,
+                                                                 urgent, should_stop=should_stop):
+                    if error:
+                        logger.error(f"Retention: {recording_id}: {error}")
+                    else:
+                        logger.info(f"Retention: {recording_id}: {', '.join(actions)}")
+                if not should_stop():
+                    next_sweep = time.monotonic() + self.SWEEP_INTERVAL
+                if urgent and not warned and disk_space_low(base_dir, self.retention):
+                    warned = True
+                    logger.warning(f"Only {format_size(free_bytes(base_dir))} free in {base_dir}, "
+                                   f"and no finished recording is left to trim")
+            except Exception as e:
+                logger.error(f"Retention sweep failed: {e}")
+                
     def test_api_connection(self):
         """Test transcription API connection"""
         try:
@@ -345,7 +1016,7 @@ class AudioVideoRecorder:
             # Test with a simple request (we'll use a dummy approach)
             test_url = api_url.replace('/transcribe/', '/')
             
-            response = requests.get(test_url, timeout=5)
+            response = self.http.get(test_url, timeout=5)
             if response.status_code == 200:
                 messagebox.showinfo("API Test", "✅ API server is responding!")
                 self.transcription_status.set("API Connected")
@@ -364,86 +1035,286 @@ class AudioVideoRecorder:
             messagebox.showerror("API Test", f"❌ API test failed: {str(e)}")
             return False
             
-    def transcribe_audio(self, audio_file_path, recording_folder):
+    def encode_for_upload(self, audio_file_path):
+        """Encode audio in the selected upload format; returns (path, mime type)"""
+        codecs = {
+            'flac': (['-c:a', 'flac', '-sample_fmt', 's16'], 'audio/flac'),
+            'opus': (['-c:a', 'libopus', '-b:a', '24k', '-application', 'voip'], 'audio/ogg'),
+        }
+        upload_format = self.upload_format_var.get()
+        if upload_format not in codecs:
+            return audio_file_path, 'audio/wav'
+            
+        args, mime_type = codecs[upload_format]
+        fd, encoded_path = tempfile.mkstemp(suffix=f".{upload_format}")
+        os.close(fd)
+        try:
+            subprocess.run(['ffmpeg', '-y', '-i', audio_file_path] + args + [encoded_path],
+                           check=True, capture_output=True)
+        except (subprocess.CalledProcessError, FileNotFoundError) as e:
+            logger.warning(f"Upload encoding failed, sending WAV instead: {e}")
+            os.remove(encoded_path)
+            return audio_file_path, 'audio/wav'
+            
+        logger.info(f"Encoded {upload_format} for upload: {os.path.getsize(audio_file_path):,} -> "
+                    f"{os.path.getsize(encoded_path):,} bytes")
+        return encoded_path, mime_type
+        
+    def upload_resumable(self, base_url, file_path):
+        """Upload a file in chunks, resuming from the server's offset after failures.
+        Returns the upload id, or None if the server has no resumable upload API."""
+        size = os.path.getsize(file_path)
+        response = self.http.post(base_url + 'uploads', 
+                                  data={'filename': os.path.basename(file_path), 'size': size}, timeout=10)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        
+        upload_id = response.json()['id']
+        upload_url = f"{base_url}uploads/{upload_id}"
+        offset = 0
+        failures = 0
+        
+        with open(file_path, 'rb') as upload_file:
+            while offset < size:
+                try:
+                    upload_file.seek(offset)
+                    chunk = upload_file.read(self.UPLOAD_CHUNK_SIZE)
+                    response = self.http.put(upload_url, params={'offset': offset}, data=chunk, timeout=30)
+                    if response.status_code == 409:
+                        # Out of step with the server - continue from where it is
+                        offset = response.json()['offset']
+                        continue
+                    response.raise_for_status()
+                    offset = response.json()['offset']
+                    failures = 0
+                    self.transcription_status.set(f"⬆️ Uploading audio... {offset * 100 // size}%")
+                    
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                    failures += 1
+                    if failures > self.UPLOAD_RETRIES:
+                        raise
+                    time.sleep(min(2 ** failures, 30))
+                    # Ask how much arrived before resending
+                    try:
+                        offset = self.http.get(upload_url, timeout=10).json()['offset']
+                    except requests.exceptions.RequestException:
+                        pass
+                        
+        return upload_id
+            
+    def open_local_transcription(self):
+        """Connect to a transcriber on this machine, or return None to use HTTP"""
+        if not self.transcription_var.get() or not self.LOCAL_SOCKET_PATH or not hasattr(socket, 'AF_UNIX'):
+            return None
+        host = requests.utils.urlparse(self.api_url_var.get()).hostname
+        if host not in ('localhost', '127.0.0.1', '::1') or not os.path.exists(self.LOCAL_SOCKET_PATH):
+            return None
+        try:
+            stream = LocalTranscriptionStream(self.LOCAL_SOCKET_PATH, self.SAMPLE_RATE,
+                                              model=self.model_var.get().strip() or None)
+            logger.info(f"Streaming audio to local transcriber at {self.LOCAL_SOCKET_PATH}")
+            return stream
+        except OSError as e:
+            logger.warning(f"Local transcriber unavailable, will upload instead: {e}")
+            return None
+            
+    def show_transcription(self, transcription_text, recording_folder, words=None):
+        """Save the transcript (and its word timings, for search) next to the recording and show it"""
+        transcript_file = write_transcript(recording_folder, transcription_text, words)
+        
+        logger.info(f"Transcription saved: {os.path.join(recording_folder, transcript_file)}")
+        # Indexes the transcript for search too
+        self.record_transcription(recording_folder, 'done', file=transcript_file,
+                                  model=self.model_var.get().strip() or None, word_count=len(words or []))
+        
+        # Update UI
+        self.transcription_text.delete(1.0, tk.END)
+        self.transcription_text.insert(tk.END, transcription_text)
+        self.transcription_status.set("✅ Transcription completed")
+        
+    def update_manifest(self, recording_folder, changes, checksums=False):
+        """Merge changes into a recording's manifest and catalog entry; failures are only logged"""
+        try:
+            catalog = RecordingCatalog(os.path.dirname(recording_folder))
+            catalog.update(recording_folder, changes)
+            if checksums:
+                catalog.add_checksums(recording_folder)
+        except Exception as e:
+            logger.error(f"Could not update manifest for {recording_folder}: {e}")
+            
+    def record_transcription(self, recording_folder, status, **details):
+        """Note the transcription outcome in the recording's manifest and the catalog"""
+        self.update_manifest(recording_folder, {'transcription': dict(details, status=status)})
+            
+    def show_partial_transcription(self, partial_text):
+        """Show the transcript received so far while the job is still running"""
+        self.transcription_text.delete(1.0, tk.END)
+        self.transcription_text.insert(tk.END, partial_text)
+        
+    def transcribe_audio(self, audio_file_path, recording_folder, local_stream=None):
         """Send audio file to transcription API"""
+        upload_path = audio_file_path
         try:
             if not self.transcription_var.get():
                 logger.info("Transcription disabled by user")
                 return None
                 
+            self.transcription_status.set("🔄 Transcribing audio...")
+            
+            # Audio was already streamed to a local transcriber during recording
+            if local_stream is not None:
+                try:
+                    result = local_stream.finish()
+                    if 'error' not in result:
+                        self.show_transcription(result.get('transcription', ''), recording_folder,
+                                                result.get('words'))
+                        return result.get('transcription', '')
+                    logger.error(f"Local transcription failed: {result['error']}")
+                except (OSError, ValueError) as e:
+                    logger.error(f"Local transcription failed, uploading instead: {e}")
+                finally:
+                    local_stream.close()
+                
             api_url = self.api_url_var.get()
             if not api_url:
                 logger.error("No API URL configured")
                 return None
-                
-            self.transcription_status.set("🔄 Transcribing audio...")
             
-            # Send file to API
-            with open(audio_file_path, 'rb') as audio_file:
-                files = {'file': (os.path.basename(audio_file_path), audio_file, 'audio/wav')}
+            # Submit as a background job and poll, so long recordings don't hit the request timeout
+            base_url = api_url.replace('/transcribe/', '/')
+            data = {'model': self.model_var.get().strip()} if self.model_var.get().strip() else {}
+            upload_path, mime_type = self.encode_for_upload(audio_file_path)
+            
+            upload_id = self.upload_resumable(base_url, upload_path)
+            if upload_id:
+                response = self.http.post(base_url + 'jobs', data=dict(data, upload_id=upload_id), timeout=30)
+            else:
+                # Server without resumable uploads - send the whole file in one request
+                with open(upload_path, 'rb') as audio_file:
+                    files = {'file': (os.path.basename(upload_path), audio_file, mime_type)}
+                    response = self.http.post(base_url + 'jobs', files=files, data=data, timeout=60)
                 
-                response = requests.post(api_url, files=files, timeout=60)
+            if response.status_code == 404:
+                # Older server without the job API - fall back to a synchronous request
+                with open(upload_path, 'rb') as audio_file:
+                    files = {'file': (os.path.basename(upload_path), audio_file, mime_type)}
+                    response = self.http.post(api_url, files=files, data=data, timeout=60)
+                result = response.json() if response.status_code == 200 else None
+            elif response.status_code in (200, 202):
+                result = self.poll_transcription_job(base_url, response.json()['id'])
+            else:
+                result = None
                 
-                if response.status_code == 200:
-                    result = response.json()
-                    transcription_text = result.get('transcription', '')
-                    
-                    # Save transcription to file
-                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                    transcript_file = os.path.join(recording_folder, f"transcript_{timestamp}.txt")
-                    
-                    with open(transcript_file, 'w', encoding='utf-8') as f:
-                        f.write(transcription_text)
-                    
-                    logger.info(f"Transcription saved: {transcript_file}")
-                    
-                    # Update UI
-                    self.transcription_text.delete(1.0, tk.END)
-                    self.transcription_text.insert(tk.END, transcription_text)
-                    self.transcription_status.set("✅ Transcription completed")
-                    
-                    return transcription_text
-                    
+            if result is not None and result.get('status', 'done') == 'done':
+                transcription_text = result.get('transcription', '')
+                self.show_transcription(transcription_text, recording_folder, result.get('words'))
+                return transcription_text
+                
+            else:
+                if result is not None:
+                    error_msg = result.get('error', 'Transcription job failed')
                 else:
                     error_msg = f"API error: {response.status_code}"
-                    logger.error(error_msg)
-                    self.transcription_status.set(f"❌ {error_msg}")
-                    return None
+                logger.error(error_msg)
+                self.transcription_status.set(f"❌ {error_msg}")
+                self.record_transcription(recording_folder, 'failed', error=error_msg)
+                return None
                     
         except requests.exceptions.ConnectionError:
             error_msg = "Cannot connect to transcription API"
             logger.error(error_msg)
             self.transcription_status.set(f"❌ {error_msg}")
+            self.record_transcription(recording_folder, 'failed', error=error_msg)
             return None
         except requests.exceptions.Timeout:
             error_msg = "API request timed out"
             logger.error(error_msg)
             self.transcription_status.set(f"❌ {error_msg}")
+            self.record_transcription(recording_folder, 'failed', error=error_msg)
             return None
         except Exception as e:
             error_msg = f"Transcription failed: {str(e)}"
             logger.error(error_msg)
             self.transcription_status.set(f"❌ Transcription failed")
+            self.record_transcription(recording_folder, 'failed', error=error_msg)
             return None
+        finally:
+            if upload_path != audio_file_path and os.path.exists(upload_path):
+                os.remove(upload_path)
             
-    def refresh_ports(self):
-        """Refresh available serial ports"""
-        try:
-            ports = serial.tools.list_ports.comports()
-            port_list = [f"{port.device} - {port.description}" for port in ports]
-            self.port_combo['values'] = port_list
+    def poll_transcription_job(self, base_url, job_id):
+        """Poll a transcription job until it finishes; returns the final job status"""
+        job_url = f"{base_url}jobs/{job_id}"
+        interval = 0.5
+        failures = 0
+        start_time = time.time()
+        partial_text = ''
+        max_interval = 5.0
+        
+        while not self.shutdown_flag.is_set():
+            time.sleep(interval)
+            # Back off to one poll every 5s while queued; every 2s while running the transcript grows
+            interval = min(interval * 2, max_interval)
             
-            if port_list:
-                self.port_combo.current(0)
-                # Extract just the device name
-                selected = port_list[0].split(' - ')[0]
-                self.serial_var.set(selected)
+            try:
+                response = self.http.get(job_url, timeout=10)
+                failures = 0
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                # Server may be restarting; queued jobs survive that
+                failures += 1
+                if failures >= 10:
+                    raise
+                continue
+                
+            if response.status_code != 200:
+                return {'status': 'failed', 'error': f"API error: {response.status_code}"}
+                
+            job = response.json()
+            if job['status'] in ('done', 'failed'):
+                return job
+                
+            elapsed = int(time.time() - start_time)
+            if 'progress' in job:
+                max_interval = 2.0
+                self.transcription_status.set(f"🔄 Transcribing audio... ({job['progress']:.0f}%, {elapsed}s)")
             else:
-                self.port_combo.set("No ports found")
+                self.transcription_status.set(f"🔄 Transcribing audio... ({job['status']}, {elapsed}s)")
                 
+            if job.get('partial_transcription') and job['partial_transcription'] != partial_text:
+                partial_text = job['partial_transcription']
+                self.root.after(0, self.show_partial_transcription, partial_text)
+            
+        return None
+            
+    def refresh_ports(self):
+        """Rescan serial ports in the background; the list fills in when the scan is done"""
+        self.port_combo.set("Scanning ports...")
+        threading.Thread(target=self.scan_ports, daemon=True).start()
+        
+    def scan_ports(self):
+        try:
+            ports = list_ports.comports()
+            port_list = [f"{port.device} - {port.description}" for port in ports]
         except Exception as e:
             logger.error(f"Error refreshing ports: {e}")
+            port_list = None
+        self.root.after(0, self.show_ports, port_list)
+        
+    def show_ports(self, port_list):
+        """Fill the port list with the scan result (None if the scan failed)"""
+        if port_list is None:
             self.port_combo['values'] = ["Error loading ports"]
+            return
+            
+        self.port_combo['values'] = port_list
+        if port_list:
+            self.port_combo.current(0)
+            # Extract just the device name
+            selected = port_list[0].split(' - ')[0]
+            self.serial_var.set(selected)
+        else:
+            self.port_combo.set("No ports found")
             
     def get_selected_port(self):
         """Get the selected port device name"""
@@ -458,7 +1329,11 @@ class AudioVideoRecorder:
     def test_esp32_connection(self):
         """Test ESP32-CAM connection with frame rate check"""
         try:
-            test_url = f"http://{self.ip_var.get()}/stream"
+            # While connected the camera is already busy; test through the local restream instead
+            if self.is_connected and self.cap and self.cap.server:
+                test_url = self.cap.url
+            else:
+                test_url = f"http://{self.ip_var.get()}/stream"
             test_cap = cv2.VideoCapture(test_url)
             test_cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
             
@@ -528,17 +1403,19 @@ class AudioVideoRecorder:
                 self.esp32_ip = self.ip_var.get()
                 self.stream_url = f"http://{self.esp32_ip}/stream"
                 
-                # Test video stream with optimized settings for sync
-                self.cap = cv2.VideoCapture(self.stream_url)
-                
-                # Optimize capture settings for better sync
-                self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Minimal buffer for lowest latency
-                self.cap.set(cv2.CAP_PROP_FPS, 25)  # Request 25 FPS from ESP32-CAM
-                self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc('M', 'J', 'P', 'G'))  # MJPEG format
+                # Single connection to the camera, shared by preview, recording and local viewers
+                self.cap = CameraRestreamer(self.stream_url, self.RESTREAM_HOST, self.RESTREAM_PORT, self.http)
                 
-                if not self.cap.isOpened():
+                if not self.cap.start():
                     raise Exception("Cannot connect to ESP32-CAM stream")
                     
+                if self.adaptive_var.get():
+                    host = self.esp32_ip.split(':')[0]
+                    self.tuner = CameraTuner(self.cap, f"http://{host}:{self.CAMERA_CONTROL_PORT}/control",
+                                             self.TARGET_FPS, lambda: not self.is_recording, self.http)
+                    if not self.tuner.start():
+                        self.tuner = None
+                    
                 # Test if we can get a frame
                 ret, frame = self.cap.read()
                 if not ret:
@@ -564,6 +1441,10 @@ class AudioVideoRecorder:
             with self.connection_lock:
                 self.is_connected = False
                 
+                if self.tuner:
+                    self.tuner.stop()
+                    self.tuner = None
+                    
                 if self.cap:
                     self.cap.release()
                     self.cap = None
@@ -626,6 +1507,7 @@ class AudioVideoRecorder:
                             
                 # Update audio level
                 self.update_audio_level()
+                self.update_capture_stats()
                 
                 time.sleep(1.0 / self.PREVIEW_FPS)  # Control preview frame rate
                 
@@ -633,14 +1515,34 @@ class AudioVideoRecorder:
                 logger.error(f"Preview error: {e}")
                 time.sleep(0.1)
                 
-    def update_preview(self, img_tk):
+    def update_preview(self, img_tk, scheduled_us=None):
         """Update preview image in main thread"""
+        if scheduled_us is not None:
+            # How long the frame waited for the Tk main loop
+            tracer.complete("tk dispatch", scheduled_us)
         try:
             self.video_label.config(image=img_tk, text="")
             self.video_label.image = img_tk  # Keep a reference
         except Exception as e:
             logger.error(f"Preview update error: {e}")
             
+    def update_capture_stats(self):
+        """Show the restream address, viewer count and camera mode, once a second"""
+        now = time.time()
+        if now - self.last_stats_update < 1.0:
+            return
+        self.last_stats_update = now
+        
+        cap = self.cap
+        if isinstance(cap, CameraRestreamer) and cap.server:
+            text = f"Restream: {cap.url} ({cap.viewers} viewers)"
+        else:
+            text = "Restream: off"
+        tuner = self.tuner
+        if tuner:
+            text += f"\nCamera: {tuner.mode}, {tuner.fps:.1f}/{tuner.target_fps:.0f} FPS"
+        self.root.after(0, self.capture_stats_var.set, text)
+        
     def update_audio_level(self):
         """Update audio level indicator"""
         try:
@@ -659,13 +1561,26 @@ class AudioVideoRecorder:
             messagebox.showerror("Error", "Please connect devices first")
             return
             
+        # The recording is held in memory until it stops, so it needs room on disk then
+        base_dir = self.output_dir.get()
+        if os.path.isdir(base_dir) and disk_space_low(base_dir, self.retention):
+            self.sweep_requested.set()
+            if not messagebox.askyesno("Low Disk Space",
+                                       f"Only {format_size(free_bytes(base_dir))} free for recordings. Old recordings "
+                                       f"are being trimmed in the background, but this one may not fit.\n\n"
+                                       f"Record anyway?"):
+                return
+            
         try:
             with self.recording_lock:
                 # Clear previous data
                 self.video_frames.clear()
                 self.audio_data.clear()
                 self.frame_timestamps.clear()
+                self.frames_skipped = 0
                 self.audio_timestamps.clear()
+                self.peaks = timeline.WaveformPeaks(self.SAMPLE_RATE)
+                self.sprites = timeline.ThumbnailSprites(self.THUMBNAIL_INTERVAL)
                 
                 # Clear transcription
                 self.transcription_text.delete(1.0, tk.END)
@@ -677,6 +1592,12 @@ class AudioVideoRecorder:
                 self.connect_btn.config(state=tk.DISABLED)
                 self.status_var.set("🔴 RECORDING")
                 
+                # Stream audio to a co-located transcriber while recording, if there is one
+                self.local_stream = self.open_local_transcription()
+                
+                if self.trace_var.get():
+                    tracer.start()
+                
                 # SYNCHRONIZED START - Set timing BEFORE starting threads
                 self.recording_start_time = time.time()
                 self.is_recording = True
@@ -731,21 +1652,28 @@ class AudioVideoRecorder:
         samples_collected = 0
         
         # Audio latency compensation (در حدود 30-50ms تأخیر Arduino و Serial)
-        audio_latency_compensation = 0.03  # 30ms جلوتر از video
+        audio_latency_compensation = self.AUDIO_LATENCY_COMPENSATION
         
         while self.is_recording:
             try:
                 if self.serial_port and self.serial_port.in_waiting > 0:
-                    data = self.serial_port.read(self.serial_port.in_waiting)
+                    with tracer.span("serial read", self.TRACE_BLOCK_THRESHOLD_MS):
+                        data = self.serial_port.read(self.serial_port.in_waiting)
                     
-                    for byte in data:
-                        # Calculate sample time with latency compensation
-                        sample_time = (samples_collected / self.SAMPLE_RATE) - audio_latency_compensation
-                        sample_time = max(0, sample_time)  # Ensure non-negative
-                        
-                        self.audio_data.append(byte)
-                        self.audio_timestamps.append(sample_time)
-                        samples_collected += 1
+                    with tracer.span("audio block", self.TRACE_BLOCK_THRESHOLD_MS, samples=len(data)):
+                        if self.local_stream is not None:
+                            self.local_stream.send(data)
+                            
+                        for byte in data:
+                            # Calculate sample time with latency compensation
+                            sample_time = (samples_collected / self.SAMPLE_RATE) - audio_latency_compensation
+                            sample_time = max(0, sample_time)  # Ensure non-negative
+                            
+                            self.audio_data.append(byte)
+                            self.audio_timestamps.append(sample_time)
+                            samples_collected += 1
+                            
+                        self.peaks.add(data)
                         
                 time.sleep(0.0005)  # Reduce sleep for better precision
                 
@@ -758,25 +1686,59 @@ class AudioVideoRecorder:
         frame_count = 0
         
         # Video latency compensation (ESP32-CAM network delay)
-        video_latency_compensation = 0.05  # 50ms تأخیر شبکه
+        video_latency_compensation = self.VIDEO_LATENCY_COMPENSATION
+        
+        decimate = self.decimate_var.get()
+        last_signature = None
+        last_stored_time = 0
+        held = None  # Latest skipped frame; stored at stop so the video covers the whole recording
+        frame_size = None  # (width, height) of the first frame; the writers need every frame this size
+        
+        tuner = self.tuner
+        if tuner:
+            tuner.hold_frame_size()
         
         while self.is_recording:
             try:
                 if self.cap and self.cap.isOpened():
-                    ret, frame = self.cap.read()
+                    with tracer.span("camera read"):
+                        ret, frame = self.cap.read()
                     if ret:
+                        if frame_size is None:
+                            frame_size = (frame.shape[1], frame.shape[0])
+                        elif (frame.shape[1], frame.shape[0]) != frame_size:
+                            # Sent before the frame size was held, or changed on the camera itself
+                            frame = cv2.resize(frame, frame_size, interpolation=cv2.INTER_AREA)
                         # Record timestamp with latency compensation
                         capture_time = (time.time() - self.recording_start_time) - video_latency_compensation
                         capture_time = max(0, capture_time)  # Ensure non-negative
-                        
-                        # Store frame and timestamp
-                        self.video_frames.append(frame.copy())
-                        self.frame_timestamps.append(capture_time)
                         frame_count += 1
                         
+                        with tracer.span("frame signature"):
+                            signature = self.frame_signature(frame) if decimate else None
+                        if (signature is not None and last_signature is not None
+                                and capture_time - last_stored_time < self.MAX_HOLD_SECONDS
+                                and np.mean(np.abs(signature - last_signature)) < self.STATIC_DIFF_THRESHOLD):
+                            # Unchanged scene: the previous frame is held until something moves
+                            held = (frame, capture_time)
+                            self.frames_skipped += 1
+                        else:
+                            # Store frame and timestamp
+                            with tracer.span("frame copy"):
+                                self.video_frames.append(frame.copy())
+                            self.frame_timestamps.append(capture_time)
+                            with tracer.span("thumbnail"):
+                                self.sprites.add(self.video_frames[-1], capture_time)
+                            last_signature, last_stored_time = signature, capture_time
+                            held = None
+                        # Audio vs video captured so far, in seconds: a widening gap shows drift
+                        tracer.counter("captured seconds", audio=len(self.audio_data) / self.SAMPLE_RATE,
+                                       video=capture_time)
+                        
                         # Update preview every 3rd frame for better performance
                         if frame_count % 3 == 0:
-                            self.update_recording_preview(frame)
+                            with tracer.span("preview convert"):
+                                self.update_recording_preview(frame)
                             
                 # Precise timing control
                 time.sleep(0.008)  # 8ms sleep for better frame timing
@@ -785,6 +1747,17 @@ class AudioVideoRecorder:
                 logger.error(f"Video recording error: {e}")
                 break
                 
+        if held is not None:
+            self.video_frames.append(held[0])
+            self.frame_timestamps.append(held[1])
+            self.sprites.add(held[0], held[1])
+            self.frames_skipped -= 1
+            
+    def frame_signature(self, frame):
+        """Tiny grayscale thumbnail used to tell whether the scene changed"""
+        small = cv2.resize(frame, (64, 48), interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.int16)
+                
     def update_recording_preview(self, frame):
         """Update preview during recording"""
         try:
@@ -802,7 +1775,7 @@ class AudioVideoRecorder:
             img = Image.fromarray(frame_rgb)
             img_tk = ImageTk.PhotoImage(img)
             
-            self.root.after(0, self.update_preview, img_tk)
+            self.root.after(0, self.update_preview, img_tk, now_us() if tracer.enabled else None)
             
         except Exception as e:
             logger.error(f"Recording preview error: {e}")
@@ -821,6 +1794,8 @@ class AudioVideoRecorder:
             
     def process_recording(self):
         """Process and save the recorded data with improved folder structure"""
+        local_stream, self.local_stream = self.local_stream, None
+        recording_folder = None
         try:
             if not self.audio_data or not self.video_frames:
                 messagebox.showerror("Error", "No data recorded!")
@@ -831,10 +1806,11 @@ class AudioVideoRecorder:
             audio_duration = len(self.audio_data) / self.SAMPLE_RATE
             video_duration = (self.frame_timestamps[-1] - self.frame_timestamps[0]) if self.frame_timestamps else 0
             frames_recorded = len(self.video_frames)
+            frames_skipped = self.frames_skipped
             samples_recorded = len(self.audio_data)
             
             logger.info(f"Recording stats: Audio={audio_duration:.2f}s ({samples_recorded} samples), "
-                       f"Video={video_duration:.2f}s ({frames_recorded} frames)")
+                       f"Video={video_duration:.2f}s ({frames_recorded} frames, {frames_skipped} static skipped)")
                 
             # Create unique recording folder
             base_dir = self.output_dir.get()
@@ -856,28 +1832,79 @@ class AudioVideoRecorder:
             # File paths
             audio_file = os.path.join(audio_dir, f"audio_{timestamp}.wav")
             video_file = os.path.join(video_dir, f"video_{timestamp}.avi")
-            final_file = os.path.join(final_dir, f"recording_{timestamp}.mp4")
             
             # Save audio
-            self.save_audio(audio_file)
+            with tracer.span("save audio", samples=samples_recorded):
+                self.save_audio(audio_file)
             logger.info(f"Audio saved: {audio_file}")
             
             # Save video
-            self.save_video(video_file)
+            with tracer.span("save video", frames=frames_recorded):
+                video_file = self.save_video(video_file)
             logger.info(f"Video saved: {video_file}")
             
+            # Timeline for scrubbing, from the peaks and thumbnails gathered during capture
+            with tracer.span("save timeline"):
+                timeline = self.save_timeline(recording_folder, video_duration)
+            
             # Combine audio and video with sync optimization
-            self.combine_audio_video(audio_file, video_file, final_file)
+            with tracer.span("finalize video"):
+                final_file, deferred_file = self.finalize_video(audio_file, video_file, final_dir, timestamp)
             logger.info(f"Final video saved: {final_file}")
             
+            # Describe the recording in its manifest and the catalog before anything updates it
+            manifest = {
+                'version': 1,
+                'id': f"recording_{timestamp}",
+                'created': datetime.strptime(timestamp, "%Y%m%d_%H%M%S").isoformat(),
+                'audio': {
+                    'file': os.path.relpath(audio_file, recording_folder),
+                    'duration': audio_duration,
+                    'samples': samples_recorded,
+                    'sample_rate': self.SAMPLE_RATE,
+                    'sample_width': 1,
+                },
+                'video': {
+                    'file': os.path.relpath(video_file, recording_folder),
+                    'duration': video_duration,
+                    'frames': frames_recorded,
+                    'frames_skipped': frames_skipped,
+                    'fps': (frames_recorded + frames_skipped - 1) / video_duration if video_duration > 0 else None,
+                    'variable_frame_rate': video_file.endswith('.mkv'),
+                },
+                'final': {
+                    'file': os.path.relpath(deferred_file or final_file, recording_folder),
+                    'proxy': os.path.relpath(final_file, recording_folder) if deferred_file else None,
+                    'pending': bool(deferred_file),
+                    'profile': self.encode_profile_var.get(),
+                    'codec_args': self.ENCODE_PROFILES[self.encode_profile_var.get()]['args'],
+                },
+                'sync': {
+                    'audio_latency_compensation': self.AUDIO_LATENCY_COMPENSATION,
+                    'video_latency_compensation': self.VIDEO_LATENCY_COMPENSATION,
+                    'mux_offset': self.MUX_SYNC_OFFSET,
+                },
+                'transcription': {'status': 'pending' if self.transcription_var.get() else 'disabled'},
+            }
+            if timeline:
+                manifest['timeline'] = timeline
+            try:
+                with tracer.span("manifest"):
+                    catalog = RecordingCatalog(base_dir)
+                    catalog.save(recording_folder, manifest)
+                threading.Thread(target=catalog.add_checksums, args=(recording_folder,), daemon=True).start()
+            except Exception as e:
+                logger.error(f"Could not write manifest for {recording_folder}: {e}")
+            
             # Start transcription in background thread
             if self.transcription_var.get():
                 transcription_thread = threading.Thread(
                     target=self.transcribe_audio, 
-                    args=(audio_file, recording_folder),
+                    args=(audio_file, recording_folder, local_stream),
                     daemon=True
                 )
                 transcription_thread.start()
+                local_stream = None  # Now owned by the transcription thread
             
             self.status_var.set("✅ Recording Saved!")
             
@@ -885,7 +1912,7 @@ class AudioVideoRecorder:
             success_msg = (
                 f"📊 Recording Statistics:\n"
                 f"• Audio: {audio_duration:.2f} seconds ({samples_recorded:,} samples)\n"
-                f"• Video: {video_duration:.2f} seconds ({frames_recorded} frames)\n"
+                f"• Video: {video_duration:.2f} seconds ({frames_recorded} frames, {frames_skipped} static skipped)\n"
                 f"• Sample Rate: {self.SAMPLE_RATE} Hz\n"
                 f"• Sync Status: ✅ Optimized\n"
             )
@@ -896,10 +1923,13 @@ class AudioVideoRecorder:
             success_msg += (
                 f"\n📁 Saved in folder: recording_{timestamp}/\n"
                 f"  ├── audio/audio_{timestamp}.wav\n"
-                f"  ├── video/video_{timestamp}.avi\n"
-                f"  └── final/recording_{timestamp}.mp4\n"
+                f"  ├── video/{os.path.basename(video_file)}\n"
+                f"  └── final/{os.path.basename(final_file)}\n"
             )
             
+            if deferred_file:
+                success_msg += f"  └── final/{os.path.basename(deferred_file)} (encoding in background...)\n"
+            
             if self.transcription_var.get():
                 success_msg += f"  └── transcript_{timestamp}.txt (processing...)\n"
                 
@@ -913,8 +1943,23 @@ class AudioVideoRecorder:
             messagebox.showerror("Error", error_msg)
             
         finally:
+            if local_stream is not None:
+                local_stream.close()
+            self.finish_trace(recording_folder)
             self.reset_ui()
             
+    def finish_trace(self, recording_folder):
+        """Write the recording's trace.json if tracing was on"""
+        if not tracer.enabled:
+            return
+        trace_file = os.path.join(recording_folder, "trace.json") if recording_folder else None
+        try:
+            events = tracer.stop(trace_file)
+            if trace_file:
+                logger.info(f"Trace saved: {trace_file} ({events} events)")
+        except OSError as e:
+            logger.error(f"Could not write trace: {e}")
+            
     def save_audio(self, filename):
         """Save raw audio data as WAV file"""
         try:
@@ -931,15 +1976,24 @@ class AudioVideoRecorder:
             raise Exception(f"Audio save error: {str(e)}")
             
     def save_video(self, filename):
-        """Save video frames with calculated frame rate"""
+        """Save video frames with calculated frame rate; returns the file written"""
         try:
             if not self.video_frames:
                 raise Exception("No video frames to save")
                 
+            # Skipped static frames leave gaps: keep each stored frame's own timestamp
+            if self.frames_skipped:
+                try:
+                    return self.save_video_vfr(os.path.splitext(filename)[0] + '.mkv')
+                except (subprocess.CalledProcessError, FileNotFoundError) as e:
+                    logger.warning(f"Variable frame rate save failed, writing constant frame rate: {e}")
+                    
             height, width = self.video_frames[0].shape[:2]
             
             # Calculate actual frame rate based on timestamps
-            if len(self.frame_timestamps) > 1:
+            if self.frames_skipped:
+                actual_fps = self.FRAME_RATE
+            elif len(self.frame_timestamps) > 1:
                 total_duration = self.frame_timestamps[-1] - self.frame_timestamps[0]
                 actual_fps = (len(self.frame_timestamps) - 1) / total_duration if total_duration > 0 else self.FRAME_RATE
                 actual_fps = max(5, min(actual_fps, 60))  # Clamp between 5-60 FPS
@@ -952,54 +2006,128 @@ class AudioVideoRecorder:
             fourcc = cv2.VideoWriter_fourcc(*'MJPG')
             out = cv2.VideoWriter(filename, fourcc, actual_fps, (width, height))
             
-            for frame in self.video_frames:
-                out.write(frame)
+            for i, frame in enumerate(self.video_frames):
+                # Held frames are repeated to fill their gap at constant frame rate
+                repeats = round(self.frame_gap(i) * actual_fps) if self.frames_skipped else 1
+                for _ in range(max(1, repeats)):
+                    out.write(frame)
                 
             out.release()
+            return filename
             
         except Exception as e:
             raise Exception(f"Video save error: {str(e)}")
             
-    def combine_audio_video(self, audio_file, video_file, output_file):
-        """Combine audio and video with precise synchronization"""
+    def frame_gap(self, index):
+        """Seconds until the next stored frame (one nominal frame for the last)"""
+        if index + 1 < len(self.frame_timestamps):
+            return self.frame_timestamps[index + 1] - self.frame_timestamps[index]
+        return 1.0 / self.FRAME_RATE
+        
+    def save_video_vfr(self, filename):
+        """Write stored frames with their own durations as MJPEG in MKV, without re-encoding in ffmpeg"""
+        logger.info(f"Saving variable frame rate video: {len(self.video_frames)} frames, "
+                    f"{self.frames_skipped} static frames skipped")
+        
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(filename)) as frames_dir:
+            list_path = os.path.join(frames_dir, "frames.ffconcat")
+            with open(list_path, 'w') as listing:
+                listing.write("ffconcat version 1.0\n")
+                with tracer.span("write frames"):
+                    for i, frame in enumerate(self.video_frames):
+                        name = f"frame_{i:06d}.jpg"
+                        cv2.imwrite(os.path.join(frames_dir, name), frame, [cv2.IMWRITE_JPEG_QUALITY, 95])
+                        listing.write(f"file '{name}'\nduration {max(self.frame_gap(i), 0.001):.6f}\n")
+                    # The concat demuxer ignores the last duration unless the file is listed again
+                    listing.write(f"file '{name}'\n")
+                
+            cmd = ['ffmpeg', '-y', '-f', 'concat', '-safe', '0', '-i', list_path, '-c:v', 'copy', filename]
+            with tracer.span("ffmpeg concat"):
+                subprocess.run(cmd, check=True, capture_output=True, text=True)
+            
+        return filename
+            
+    def save_timeline(self, recording_folder, video_duration):
+        """Write waveform peaks and thumbnail sprites; returns their manifest entry, or None if that failed"""
+        timeline_dir = os.path.join(recording_folder, timeline.TIMELINE_DIR)
         try:
-            # Get audio and video durations
-            audio_duration = len(self.audio_data) / self.SAMPLE_RATE
+            entry = {
+                'peaks': [os.path.join(timeline.TIMELINE_DIR, name) for name in self.peaks.save(timeline_dir)],
+                'thumbnails': None,
+                'thumbnail_interval': self.THUMBNAIL_INTERVAL,
+            }
+            thumbnails = self.sprites.save(timeline_dir, video_duration)
+            if thumbnails:
+                entry['thumbnails'] = os.path.join(timeline.TIMELINE_DIR, thumbnails)
+            logger.info(f"Timeline saved: {timeline_dir}")
+            return entry
+        except Exception as e:
+            # Only a convenience for reviewing; the recording itself is unaffected
+            logger.error(f"Could not save timeline: {e}")
+            return None
             
-            if self.frame_timestamps:
-                video_duration = self.frame_timestamps[-1] - self.frame_timestamps[0]
-            else:
-                video_duration = audio_duration
+    def target_duration(self):
+        """Duration the final file is trimmed to: the shorter of the audio and video"""
+        audio_duration = len(self.audio_data) / self.SAMPLE_RATE
+        
+        if self.frame_timestamps:
+            video_duration = self.frame_timestamps[-1] - self.frame_timestamps[0]
+        else:
+            video_duration = audio_duration
+        
+        logger.info(f"Audio duration: {audio_duration:.3f}s, Video duration: {video_duration:.3f}s")
+        return min(audio_duration, video_duration)
+        
+    def finalize_video(self, audio_file, video_file, final_dir, timestamp):
+        """Write the final A/V file; returns it and the file still being encoded in the background, if any"""
+        profile = self.encode_profile_var.get()
+        target_duration = self.target_duration()
+        final_file = os.path.join(final_dir, f"recording_{timestamp}.{self.ENCODE_PROFILES[profile]['ext']}")
+        
+        if not self.two_tier_var.get() or profile == "copy":
+            self.combine_audio_video(audio_file, video_file, final_file, profile, target_duration)
+            return final_file, None
             
-            logger.info(f"Audio duration: {audio_duration:.3f}s, Video duration: {video_duration:.3f}s")
+        # Stream-copy proxy is playable in seconds; the real encode waits its turn at low priority
+        proxy_file = os.path.join(final_dir, f"recording_{timestamp}_proxy.mkv")
+        self.combine_audio_video(audio_file, video_file, proxy_file, "copy", target_duration)
+        self.encode_queue.put((audio_file, video_file, final_file, profile, target_duration))
+        return proxy_file, final_file
+        
+    def deferred_encode_worker(self):
+        """Run queued high-quality encodes one at a time, below normal priority"""
+        while not self.shutdown_flag.is_set():
+            try:
+                audio_file, video_file, output_file, profile, target_duration = self.encode_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+                
+            recording_folder = os.path.dirname(os.path.dirname(output_file))
+            try:
+                self.combine_audio_video(audio_file, video_file, output_file, profile, target_duration,
+                                         low_priority=True)
+                logger.info(f"High-quality encode saved: {output_file}")
+                self.update_manifest(recording_folder, {'final': {'pending': False}}, checksums=True)
+            except Exception as e:
+                logger.error(f"Background encode failed, proxy kept: {e}")
+                proxy = (read_manifest(recording_folder) or {}).get('final', {}).get('proxy')
+                self.update_manifest(recording_folder, {'final': {'pending': False, 'file': proxy, 'error': str(e)}})
+                
+    def combine_audio_video(self, audio_file, video_file, output_file, profile="balanced",
+                            target_duration=None, low_priority=False):
+        """Combine audio and video with precise synchronization"""
+        try:
+            if target_duration is None:
+                target_duration = self.target_duration()
             
             # Fine-tune sync offset (positive = delay audio, negative = advance audio)
-            sync_offset = 0.02  # 20ms audio delay to match video better
-            
-            # Calculate target duration
-            target_duration = min(audio_duration, video_duration)
-            
-            cmd = [
-                'ffmpeg', '-y',  # Overwrite output
-                '-i', video_file,
-                '-itsoffset', str(sync_offset),  # Audio delay for sync
-                '-i', audio_file,
-                '-c:v', 'libx264',     # Video codec
-                '-c:a', 'aac',         # Audio codec
-                '-preset', 'medium',   # Encoding speed/quality balance
-                '-crf', '20',          # Better quality (lower CRF)
-                '-t', str(target_duration),  # Set target duration
-                '-avoid_negative_ts', 'make_zero',  # Handle timestamp issues
-                '-fflags', '+genpts',  # Generate timestamps
-                '-vsync', 'cfr',       # Constant frame rate
-                '-async', '1',         # Audio sync correction
-                '-map', '0:v:0',       # Map video from first input
-                '-map', '1:a:0',       # Map audio from second input
-                output_file
-            ]
-            
-            logger.info(f"FFmpeg command: {' '.join(cmd)}")
-            result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+            sync_offset = self.MUX_SYNC_OFFSET
+            
+            threads = self.DEFERRED_ENCODE_THREADS if low_priority else self.ENCODE_THREADS
+            
+            with tracer.span("ffmpeg mux", profile=profile, threads=threads):
+                mux_audio_video(audio_file, video_file, output_file, profile, sync_offset, target_duration,
+                                threads, low_priority)
             logger.info(f"FFmpeg completed successfully. Sync offset: {sync_offset}s")
             
         except subprocess.CalledProcessError as e:
@@ -1042,17 +2170,8 @@ class AudioVideoRecorder:
             logger.error(f"Shutdown error: {e}")
             self.root.destroy()
 
-def main():
-    """Main function"""
-    # Check required libraries
-    try:
-        import requests
-    except ImportError:
-        print("❌ Error: 'requests' library is required for API communication")
-        print("Install with: pip install requests")
-        return
-        
-    # Check FFmpeg availability
+def check_ffmpeg():
+    """Warn if FFmpeg is missing"""
     try:
         subprocess.run(['ffmpeg', '-version'], capture_output=True, check=True)
         logger.info("FFmpeg found")
@@ -1061,19 +2180,46 @@ def main():
         print("Please install FFmpeg for video processing.")
         print("Download from: https://ffmpeg.org/download.html")
         
-    # Check if transcription API is available
+def check_api():
+    """Report whether the transcription API is running"""
     try:
-        response = requests.get("http://localhost:8000/", timeout=2)
+        response = http_session.get("http://localhost:8000/", timeout=2)
         logger.info("Transcription API server detected")
     except:
         print("💡 Info: Transcription API server not running on port 8000")
         print("Start the transcription server to enable speech-to-text functionality")
         
+def preload_modules():
+    """Import what connecting and recording need while the user is still looking at the window"""
+    for module in (np, cv2, Image, ImageTk, serial, timeline):
+        try:
+            module.load()
+        except ImportError as e:
+            logger.error(f"Could not load module: {e}")
+            
+def main():
+    """Main function"""
+    # Check required libraries (without importing them yet)
+    if importlib.util.find_spec('requests') is None:
+        print("❌ Error: 'requests' library is required for API communication")
+        print("Install with: pip install requests")
+        return
+        
     # Create and run application
     root = tk.Tk()
     app = AudioVideoRecorder(root)
     root.protocol("WM_DELETE_WINDOW", app.on_closing)
     
+    def report_first_window(event):
+        if event.widget is root:
+            logger.info(f"Window shown {(time.perf_counter() - STARTED) * 1000:.0f} ms after start")
+            root.unbind('<Map>')
+    root.bind('<Map>', report_first_window)
+    
+    # Environment checks run alongside each other instead of before the window
+    for check in (check_ffmpeg, check_api, preload_modules):
+        threading.Thread(target=check, daemon=True).start()
+    
     try:
         root.mainloop()
     except KeyboardInterrupt:
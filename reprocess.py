@@ -0,0 +1,339 @@
+"""Re-mux or re-transcribe saved recordings in bulk, without re-recording.
+
+Works from each recording's audio/*.wav and video/*.avi (or .mkv) and its manifest, so
+it needs no GUI session. Recordings run in parallel across a process pool. Each output
+is stored with a fingerprint of its inputs' content and settings, so a recording that
+is already up to date is skipped. That also makes an interrupted run resumable: run
+the same command again and it carries on where it stopped.
+
+    python reprocess.py recordings --remux --sync-offset 0.04
+    python reprocess.py recordings --remux --profile archival --jobs 4
+    python reprocess.py recordings --retranscribe --model vosk-model-en-us-0.22
+    python reprocess.py recordings --timeline     # waveform peaks and thumbnails for older recordings
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import socket
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from catalog import (FOLDER_PREFIX, RecordingCatalog, media_checksum, parse_date, read_manifest,
+                     transcript_source, write_transcript)
+
+# requests and timeline (cv2, numpy) are imported where they're used: the recorder imports this
+# module for ENCODE_PROFILES and mux_audio_video, and its window shouldn't wait for them
+
+logger = logging.getLogger(__name__)
+
+# Final encode profiles: container extension and ffmpeg codec arguments
+ENCODE_PROFILES = {
+    "copy": {"ext": "mkv", "args": ['-c:v', 'copy', '-c:a', 'flac']},  # MJPEG as recorded
+    "fast": {"ext": "mp4", "args": ['-c:v', 'libx264', '-preset', 'ultrafast', '-crf', '23',
+                                    '-vsync', 'vfr', '-c:a', 'aac']},
+    "balanced": {"ext": "mp4", "args": ['-c:v', 'libx264', '-preset', 'medium', '-crf', '20',
+                                        '-vsync', 'vfr', '-c:a', 'aac']},
+    "archival": {"ext": "mp4", "args": ['-c:v', 'libx264', '-preset', 'slow', '-crf', '18',
+                                        '-vsync', 'vfr', '-c:a', 'aac']},
+    # Smaller files at lower quality, for recordings moved to cold storage (see retention.py)
+    "compact": {"ext": "mp4", "args": ['-c:v', 'libx264', '-preset', 'slow', '-crf', '26',
+                                       '-vsync', 'vfr', '-c:a', 'aac', '-b:a', '64k']},
+}
+DEFAULT_PROFILE = "balanced"
+DEFAULT_SYNC_OFFSET = 0.02
+DEFAULT_API_URL = "http://localhost:8000/transcribe/"
+TRANSCRIBE_TIMEOUT = 3600  # Seconds to wait for one transcription job
+
+def low_priority_command(cmd):
+    """Command and subprocess options that run a child below normal priority, so it yields to live capture.
+    `nice` goes in front of the command: preexec_fn can deadlock the child of a multi-threaded parent."""
+    if os.name == 'nt':
+        return cmd, {'creationflags': subprocess.BELOW_NORMAL_PRIORITY_CLASS}
+    if shutil.which('nice'):
+        return ['nice', '-n', '10', *cmd], {}
+    return cmd, {}
+
+def mux_audio_video(audio_file, video_file, output_file, profile, sync_offset, target_duration=None,
+                    threads=1, low_priority=False):
+    """Combine audio and video with ffmpeg; sync_offset delays the audio (negative advances it)"""
+    cmd = [
+        'ffmpeg', '-y',  # Overwrite output
+        '-i', video_file,
+        '-itsoffset', str(sync_offset),  # Audio delay for sync
+        '-i', audio_file,
+        *ENCODE_PROFILES[profile]['args'],  # Codecs, speed/quality balance
+        '-threads', str(threads),  # Encoder threads
+    ]
+    if target_duration:
+        cmd += ['-t', str(target_duration)]  # Trim to the shorter stream
+    cmd += [
+        '-avoid_negative_ts', 'make_zero',  # Handle timestamp issues
+        '-fflags', '+genpts',  # Generate timestamps
+        '-async', '1',         # Audio sync correction
+        '-map', '0:v:0',       # Map video from first input
+        '-map', '1:a:0',       # Map audio from second input
+        output_file
+    ]
+    logger.info(f"FFmpeg command: {' '.join(cmd)}")
+    options = {}
+    if low_priority:
+        cmd, options = low_priority_command(cmd)
+    return subprocess.run(cmd, check=True, capture_output=True, text=True, **options)
+
+def fingerprint(*parts):
+    """Stable hash of input checksums and settings; equal fingerprints mean an output is up to date"""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+def transcribe_file(session, api_url, audio_file, model=None, timeout=TRANSCRIBE_TIMEOUT):
+    """Transcribe a file as a low-priority job on the server, so live recordings go first; returns the result"""
+    base_url = api_url.replace('/transcribe/', '/')
+    data = {'priority': 'low'}
+    if model:
+        data['model'] = model
+    with open(audio_file, 'rb') as f:
+        files = {'file': (os.path.basename(audio_file), f, 'audio/wav')}
+        response = session.post(base_url + 'jobs', files=files, data=data, timeout=60)
+    if response.status_code == 404:
+        # Older server without the job API
+        with open(audio_file, 'rb') as f:
+            files = {'file': (os.path.basename(audio_file), f, 'audio/wav')}
+            response = session.post(api_url, files=files, data={'model': model} if model else {}, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+    response.raise_for_status()
+
+    job_url = f"{base_url}jobs/{response.json()['id']}"
+    deadline = time.time() + timeout
+    interval = 0.5
+    while time.time() < deadline:
+        time.sleep(interval)
+        interval = min(interval * 2, 5.0)
+        response = session.get(job_url, timeout=10)
+        response.raise_for_status()
+        job = response.json()
+        if job['status'] == 'done':
+            return job
+        if job['status'] == 'failed':
+            raise RuntimeError(job.get('error') or "Transcription job failed")
+    raise RuntimeError(f"Transcription did not finish within {timeout}s")
+
+def input_checksums(folder, manifest, sections, changes):
+    """Checksums of the recording's inputs; newly computed ones are added to changes"""
+    checksums = []
+    for section in sections:
+        checksum, cached = media_checksum(folder, manifest[section])
+        if cached:
+            changes.setdefault(section, {}).update(cached)
+        # Audio recompressed losslessly (WAV to FLAC by retention.py) keeps its original content checksum
+        checksums.append(manifest[section].get('content_sha256') or checksum)
+    return checksums
+
+def remux(folder, manifest, options, changes):
+    """Rebuild final/ from the saved audio and video unless it already matches the requested settings"""
+    audio = manifest.get('audio', {})
+    video = manifest.get('video', {})
+    final = manifest.get('final', {})
+    if not audio.get('file') or not video.get('file'):
+        logger.info(f"{folder}: no audio or video to mux")
+        return None
+
+    profile = options['profile'] or final.get('profile') or DEFAULT_PROFILE
+    sync_offset = options['sync_offset']
+    if sync_offset is None:
+        sync_offset = manifest.get('sync', {}).get('mux_offset', DEFAULT_SYNC_OFFSET)
+    durations = [d for d in (audio.get('duration'), video.get('duration')) if d]
+    target_duration = min(durations) if durations else None
+
+    checksums = input_checksums(folder, manifest, ('audio', 'video'), changes)
+    wanted = fingerprint(checksums, ENCODE_PROFILES[profile]['args'], sync_offset, target_duration)
+    current = final.get('fingerprint')
+    final_exists = bool(final.get('file')) and os.path.exists(os.path.join(folder, final['file']))
+    if current is None and final_exists and not final.get('pending') and not final.get('error'):
+        # Made by the recorder: judge it by the settings its manifest records
+        current = fingerprint(checksums, final.get('codec_args'),
+                              manifest.get('sync', {}).get('mux_offset'), target_duration)
+    if current == wanted and final_exists and not options['force']:
+        return None
+
+    stem = f"recording_{os.path.basename(folder)[len(FOLDER_PREFIX):]}"
+    output_file = os.path.join(folder, "final", f"{stem}.{ENCODE_PROFILES[profile]['ext']}")
+    # Written under a temporary name so an interrupted encode never replaces a good file
+    partial_file = os.path.join(folder, "final", f"{stem}.partial.{ENCODE_PROFILES[profile]['ext']}")
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    try:
+        mux_audio_video(os.path.join(folder, audio['file']), os.path.join(folder, video['file']), partial_file,
+                        profile, sync_offset, target_duration, options['threads'], low_priority=True)
+        os.replace(partial_file, output_file)
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"FFmpeg error: {e.stderr.strip().splitlines()[-1] if e.stderr.strip() else e}")
+    finally:
+        if os.path.exists(partial_file):
+            os.remove(partial_file)
+
+    output_relative = os.path.relpath(output_file, folder)
+    output_checksum, cached = media_checksum(folder, {'file': output_relative})
+    changes['final'] = dict(cached, file=output_relative, profile=profile, pending=False, error=None,
+                            codec_args=ENCODE_PROFILES[profile]['args'], fingerprint=wanted)
+    # A profile with another container leaves the previous final behind: it's superseded, so remove it
+    previous = final.get('file')
+    if final_exists and not final.get('pending') and os.path.normpath(previous) != os.path.normpath(output_relative):
+        os.remove(os.path.join(folder, previous))
+        if final.get('proxy') == previous:
+            changes['final']['proxy'] = None
+    changes['sync'] = {'mux_offset': sync_offset}
+    return f"remuxed ({profile}, offset {sync_offset:+.3f}s)"
+
+def retranscribe(folder, manifest, options, changes):
+    """Transcribe the saved audio again unless the current transcript came from it with the same model"""
+    audio = manifest.get('audio', {})
+    transcription = manifest.get('transcription', {})
+    if not audio.get('file'):
+        logger.info(f"{folder}: no audio to transcribe")
+        return None
+
+    model = options['model'] or transcription.get('model')
+    checksums = input_checksums(folder, manifest, ('audio',), changes)
+    wanted = fingerprint(checksums, model)
+    current = transcription.get('fingerprint')
+    done = transcription.get('status') == 'done' and transcript_source(folder, transcription.get('file'))
+    if current is None and done:
+        current = fingerprint(checksums, transcription.get('model'))
+    if current == wanted and done and not options['force']:
+        return None
+
+    import requests
+    session = requests.Session()
+    session.headers['X-Client-Id'] = socket.gethostname()
+    try:
+        result = transcribe_file(session, options['api_url'], os.path.join(folder, audio['file']), model)
+    except (requests.exceptions.RequestException, RuntimeError) as e:
+        if not done:
+            changes['transcription'] = {'status': 'failed', 'error': str(e)}
+        raise RuntimeError(f"Transcription failed: {e}")
+
+    words = result.get('words') or []
+    transcript_file = write_transcript(folder, result.get('transcription', ''), words)
+    changes['transcription'] = {'status': 'done', 'file': transcript_file, 'model': model,
+                                'word_count': len(words), 'fingerprint': wanted, 'error': None}
+    return f"transcribed ({len(words)} words)"
+
+def rebuild_timeline(folder, manifest, options, changes):
+    """Compute waveform peaks and thumbnail sprites from the saved media unless they're current"""
+    audio = manifest.get('audio', {})
+    video = manifest.get('video', {})
+    timeline = manifest.get('timeline', {})
+    if not audio.get('file') or not video.get('file'):
+        logger.info(f"{folder}: no audio or video for a timeline")
+        return None
+
+    checksums = input_checksums(folder, manifest, ('audio', 'video'), changes)
+    wanted = fingerprint(checksums, options['thumbnail_interval'])
+    current = timeline.get('fingerprint')
+    if current is None and timeline.get('peaks'):
+        # Made while recording, from the same samples and frames
+        current = fingerprint(checksums, timeline.get('thumbnail_interval'))
+    if current == wanted and not options['force']:
+        return None
+
+    from timeline import TIMELINE_DIR, timeline_from_files
+    built = timeline_from_files(os.path.join(folder, audio['file']), os.path.join(folder, video['file']),
+                                os.path.join(folder, TIMELINE_DIR), options['thumbnail_interval'])
+    changes['timeline'] = {
+        'peaks': [os.path.join(TIMELINE_DIR, name) for name in built['peaks']],
+        'thumbnails': os.path.join(TIMELINE_DIR, built['thumbnails']) if built['thumbnails'] else None,
+        'thumbnail_interval': built['thumbnail_interval'],
+        'fingerprint': wanted,
+    }
+    return "timeline built"
+
+def reprocess_recording(folder, options):
+    """Worker: bring one recording's outputs up to date. Returns (folder, manifest changes, actions, error);
+    the parent process applies the changes, so only one process writes the catalog."""
+    changes = {}
+    actions = []
+    try:
+        manifest = read_manifest(folder)
+        if manifest is None:
+            return folder, changes, actions, "no manifest"
+        steps = ((remux, options['remux']), (retranscribe, options['retranscribe']),
+                 (rebuild_timeline, options['timeline']))
+        for step, enabled in steps:
+            if enabled:
+                action = step(folder, manifest, options, changes)
+                if action:
+                    actions.append(action)
+        return folder, changes, actions, None
+    except Exception as e:
+        return folder, changes, actions, str(e)
+
+def main():
+    from timeline import THUMBNAIL_INTERVAL
+    parser = argparse.ArgumentParser(description="Re-mux or re-transcribe saved recordings in parallel")
+    parser.add_argument('recordings_dir', nargs='?', default='recordings')
+    parser.add_argument('--remux', action='store_true', help="rebuild final/ from the saved audio and video")
+    parser.add_argument('--retranscribe', action='store_true', help="transcribe the saved audio again")
+    parser.add_argument('--timeline', action='store_true', help="build waveform peaks and thumbnail sprites")
+    parser.add_argument('--profile', choices=list(ENCODE_PROFILES), help="encode profile (default: as recorded)")
+    parser.add_argument('--sync-offset', type=float, help="audio delay in seconds (default: as recorded)")
+    parser.add_argument('--model', help="transcription model (default: as recorded)")
+    parser.add_argument('--thumbnail-interval', type=float, default=THUMBNAIL_INTERVAL,
+                        help="seconds between timeline thumbnails")
+    parser.add_argument('--api-url', default=os.getenv("TRANSCRIBER_URL", DEFAULT_API_URL))
+    parser.add_argument('--since', type=parse_date, help="created on or after (YYYYMMDD or ISO)")
+    parser.add_argument('--until', type=parse_date, help="created before (YYYYMMDD or ISO)")
+    parser.add_argument('--jobs', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="recordings processed in parallel")
+    parser.add_argument('--force', action='store_true', help="redo recordings that are already up to date")
+    args = parser.parse_args()
+    if not (args.remux or args.retranscribe or args.timeline):
+        parser.error("choose at least one of --remux, --retranscribe and --timeline")
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    catalog = RecordingCatalog(args.recordings_dir)
+    catalog.sync()
+    folders = [os.path.join(args.recordings_dir, row['id'])
+               for row in catalog.query(since=args.since, until=args.until, limit=-1)]
+    options = {
+        'remux': args.remux, 'retranscribe': args.retranscribe, 'timeline': args.timeline,
+        'thumbnail_interval': args.thumbnail_interval, 'profile': args.profile,
+        'sync_offset': args.sync_offset, 'model': args.model, 'api_url': args.api_url, 'force': args.force,
+        # ffmpeg threads per worker, so parallel encodes share the cores instead of oversubscribing
+        'threads': max(1, (os.cpu_count() or 1) // args.jobs),
+    }
+
+    counts = {'updated': 0, 'up to date': 0, 'failed': 0}
+    started = time.time()
+    executor = ProcessPoolExecutor(max_workers=args.jobs)
+    try:
+        futures = [executor.submit(reprocess_recording, folder, options) for folder in folders]
+        for done, future in enumerate(as_completed(futures), 1):
+            folder, changes, actions, error = future.result()
+            # Record each result as it arrives: everything finished so far survives an interruption
+            if changes:
+                catalog.update(folder, changes)
+            name = os.path.basename(folder)
+            if error:
+                counts['failed'] += 1
+                print(f"[{done}/{len(folders)}] {name}: failed: {error}")
+            elif actions:
+                counts['updated'] += 1
+                print(f"[{done}/{len(folders)}] {name}: {', '.join(actions)}")
+            else:
+                counts['up to date'] += 1
+    except KeyboardInterrupt:
+        executor.shutdown(wait=False, cancel_futures=True)
+        print("Interrupted; run the same command again to resume")
+        raise SystemExit(130)
+    executor.shutdown()
+
+    summary = ", ".join(f"{count} {label}" for label, count in counts.items())
+    print(f"{len(folders)} recordings in {time.time() - started:.1f}s: {summary}")
+    if counts['failed']:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
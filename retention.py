@@ -0,0 +1,365 @@
+"""Retention policies and storage tiering for the recordings directory.
+
+A recording starts with three full copies of its content: audio/*.wav, the MJPEG
+video/*.avi (or .mkv) and the final container. A sweep moves each recording down the
+tiers as it ages:
+
+    hot       as recorded
+    final     after --keep-intermediates days the video (and a leftover proxy) is deleted and
+              the WAV is compressed losslessly to FLAC, or deleted too with --final-only; the
+              final container, transcript and timeline stay
+    archived  after --archive-after days a final that is still MJPEG ("copy") or a "fast" encode
+              is re-encoded with the compact profile, and replaced if that made it smaller
+
+Nothing is removed until the recording's final container is complete (not pending, no
+error, checksum recorded and the file unchanged since) and its transcription has
+finished. Finals without a checksum (recordings from before manifests had them) are
+hashed first. Finals are never deleted.
+
+Below the free-space watermark a sweep ignores ages and trims the oldest recordings
+first until there is room again, so the capture held in memory can always be saved.
+Work is paced to an average I/O rate and ffmpeg runs at idle I/O and low CPU priority,
+so a sweep doesn't compete with a live recording.
+
+    python retention.py recordings --dry-run --keep-intermediates 7
+    python retention.py recordings --keep-intermediates 7 --archive-after 90
+    python retention.py recordings --keep-intermediates 0 --final-only
+"""
+import argparse
+import copy
+import logging
+import os
+import shutil
+import subprocess
+import time
+from datetime import datetime
+
+from catalog import FOLDER_PREFIX, RecordingCatalog, media_checksum, merge, read_manifest
+from reprocess import ENCODE_PROFILES, low_priority_command
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_PROFILE = "compact"
+ARCHIVE_FROM = ("copy", "fast")  # Profiles worth re-encoding for cold storage
+SETTLE_SECONDS = 60  # A final modified more recently than this may still be being written
+MIN_FREE_GB = 2.0  # Free-space watermark on the recordings disk; 0 disables it
+IO_RATE_MB = 20.0  # Average MB/s a sweep may read plus write; 0 = unpaced
+
+def env_days(name):
+    value = os.getenv(name)
+    return float(value) if value else None
+
+class RetentionPolicy:
+    """What a sweep may do. Ages are in days; None keeps that tier forever."""
+
+    def __init__(self, keep_intermediates_days=None, final_only=False, archive_after_days=None,
+                 archive_profile=ARCHIVE_PROFILE, min_free_bytes=MIN_FREE_GB * 2**30, io_rate=IO_RATE_MB * 2**20):
+        self.keep_intermediates_days = keep_intermediates_days
+        self.final_only = final_only
+        self.archive_after_days = archive_after_days
+        self.archive_profile = archive_profile
+        self.min_free_bytes = min_free_bytes
+        self.io_rate = io_rate
+
+    @classmethod
+    def from_env(cls):
+        return cls(keep_intermediates_days=env_days("KEEP_INTERMEDIATES_DAYS"),
+                   final_only=os.getenv("RETENTION_FINAL_ONLY") == "1",
+                   archive_after_days=env_days("ARCHIVE_AFTER_DAYS"),
+                   archive_profile=os.getenv("ARCHIVE_PROFILE", ARCHIVE_PROFILE),
+                   min_free_bytes=float(os.getenv("MIN_FREE_DISK_GB", MIN_FREE_GB)) * 2**30,
+                   io_rate=float(os.getenv("SWEEP_IO_RATE_MB", IO_RATE_MB)) * 2**20)
+
+def free_bytes(path):
+    return shutil.disk_usage(path).free
+
+def disk_space_low(path, policy):
+    return free_bytes(path) < policy.min_free_bytes
+
+def format_size(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(size) < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+def run_ffmpeg(args):
+    """Run ffmpeg below normal CPU priority and, where ionice exists, in the idle I/O class"""
+    cmd = ['ffmpeg', '-y', '-v', 'error', *args]
+    if shutil.which('ionice'):
+        cmd = ['ionice', '-c', '3', *cmd]
+    cmd, options = low_priority_command(cmd)
+    try:
+        subprocess.run(cmd, check=True, capture_output=True, text=True, **options)
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"FFmpeg error: {e.stderr.strip().splitlines()[-1] if e.stderr.strip() else e}")
+
+def existing(folder, relative):
+    """Absolute path of a manifest file entry if the file is there, else None"""
+    if not relative:
+        return None
+    path = os.path.join(folder, relative)
+    return path if os.path.exists(path) else None
+
+def remove_file(path):
+    """Delete a file and its directory if that leaves it empty; returns the bytes freed"""
+    size = os.path.getsize(path)
+    os.remove(path)
+    try:
+        os.rmdir(os.path.dirname(path))
+    except OSError:
+        pass
+    return size
+
+def recording_age_days(manifest, now):
+    try:
+        created = datetime.fromisoformat(manifest['created']).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return None
+    return (now - created) / 86400
+
+def final_complete(folder, manifest):
+    """True when the final container is finished and matches the checksum recorded for it"""
+    final = manifest.get('final', {})
+    path = existing(folder, final.get('file'))
+    if path is None or final.get('pending') or final.get('error') or not final.get('sha256'):
+        return False
+    stat = os.stat(path)
+    return final.get('sha256_stat') == [stat.st_size, stat.st_mtime_ns]
+
+def record_final_checksum(catalog, folder, manifest, dry_run=False):
+    """Hash a final whose checksum is missing or stale (e.g. a backfilled manifest) so final_complete()
+    can judge it; returns the updated manifest and the bytes read"""
+    final = manifest.get('final', {})
+    path = existing(folder, final.get('file'))
+    if path is None or final.get('pending') or time.time() - os.path.getmtime(path) < SETTLE_SECONDS:
+        return manifest, 0
+    checksum, cached = media_checksum(folder, final)
+    if not cached:
+        return manifest, 0
+    if dry_run:
+        manifest = merge(copy.deepcopy(manifest), {'final': cached})
+    else:
+        manifest = catalog.update(folder, {'final': cached})
+    return manifest, os.path.getsize(path)
+
+def final_profile(final):
+    """The final's encode profile; backfilled manifests don't record it, but only "copy" made .mkv finals"""
+    if final.get('profile'):
+        return final['profile']
+    return "copy" if (final.get('file') or '').endswith('.mkv') else None
+
+def needs_trim(folder, manifest, policy):
+    audio = manifest.get('audio', {}).get('file')
+    final = manifest.get('final', {})
+    return bool(existing(folder, manifest.get('video', {}).get('file'))
+                or (final.get('proxy') != final.get('file') and existing(folder, final.get('proxy')))
+                or (existing(folder, audio) and (policy.final_only or not audio.endswith('.flac'))))
+
+def needs_archive(folder, manifest, policy):
+    final = manifest.get('final', {})
+    return (not manifest.get('storage', {}).get('archived') and final_profile(final) in ARCHIVE_FROM
+            and final_profile(final) != policy.archive_profile and final_complete(folder, manifest))
+
+def trim(folder, manifest, policy, dry_run=False):
+    """Delete the intermediates, keeping the audio as FLAC unless the policy is final-only.
+    Returns (manifest changes, actions, bytes freed, bytes read and written)."""
+    changes, actions = {}, []
+    freed = io_bytes = 0
+    stamp = datetime.now().isoformat(timespec='seconds')
+
+    # Compress first: if ffmpeg fails, nothing has been deleted yet
+    audio = manifest.get('audio', {})
+    audio_path = existing(folder, audio.get('file'))
+    if audio_path and not policy.final_only and not audio_path.endswith('.flac'):
+        size = os.path.getsize(audio_path)
+        if dry_run:
+            actions.append(f"audio to FLAC ({format_size(size)})")
+        else:
+            flac_relative = os.path.splitext(audio['file'])[0] + ".flac"
+            partial_path = os.path.join(folder, os.path.splitext(audio['file'])[0] + ".partial.flac")
+            try:
+                run_ffmpeg(['-i', audio_path, '-c:a', 'flac', partial_path])
+                os.replace(partial_path, os.path.join(folder, flac_relative))
+            finally:
+                if os.path.exists(partial_path):
+                    os.remove(partial_path)
+            content_sha256 = audio.get('content_sha256') or media_checksum(folder, audio)[0]
+            checksum, cached = media_checksum(folder, {'file': flac_relative})
+            flac_size = os.path.getsize(os.path.join(folder, flac_relative))
+            os.remove(audio_path)
+            # Lossless, so re-transcription fingerprints keep using the checksum of the original samples
+            changes['audio'] = dict(cached, file=flac_relative, format='flac', content_sha256=content_sha256)
+            actions.append(f"audio to FLAC ({format_size(size)} -> {format_size(flac_size)})")
+            freed += size - flac_size
+            io_bytes += size + flac_size
+
+    final = manifest.get('final', {})
+    deletions = [('video', 'file', manifest.get('video', {}).get('file'), "video")]
+    if final.get('proxy') != final.get('file'):
+        deletions.append(('final', 'proxy', final.get('proxy'), "proxy"))
+    if policy.final_only:
+        deletions.append(('audio', 'file', audio.get('file'), "audio"))
+    for section, key, relative, label in deletions:
+        path = existing(folder, relative)
+        if path:
+            size = os.path.getsize(path) if dry_run else remove_file(path)
+            changes.setdefault(section, {}).update({key: None, 'deleted': stamp} if key == 'file' else {key: None})
+            actions.append(f"{label} deleted ({format_size(size)})")
+            freed += size
+
+    if changes:
+        changes['storage'] = {'tier': 'final', 'trimmed': stamp}
+    return changes, actions, freed, io_bytes
+
+def archive(folder, manifest, policy, dry_run=False):
+    """Re-encode the final with the archive profile and keep the result if it's smaller"""
+    final = manifest['final']
+    source = os.path.join(folder, final['file'])
+    size = os.path.getsize(source)
+    profile = policy.archive_profile
+    if dry_run:
+        return {}, [f"archive {final['file']} as {profile} ({format_size(size)})"], 0, 0
+
+    stem = f"recording_{os.path.basename(os.path.normpath(folder))[len(FOLDER_PREFIX):]}"
+    extension = ENCODE_PROFILES[profile]['ext']
+    output_file = os.path.join(folder, "final", f"{stem}.{extension}")
+    partial_file = os.path.join(folder, "final", f"{stem}.partial.{extension}")
+    stamp = datetime.now().isoformat(timespec='seconds')
+    try:
+        run_ffmpeg(['-i', source, '-map', '0:v:0', '-map', '0:a:0?', *ENCODE_PROFILES[profile]['args'],
+                    '-threads', '1', partial_file])
+        archived_size = os.path.getsize(partial_file)
+        if archived_size >= size:
+            changes = {'storage': {'archived': stamp, 'archive_kept_original': True}}
+            return changes, [f"kept {final['file']} ({profile} was not smaller)"], 0, size + archived_size
+        os.replace(partial_file, output_file)
+    finally:
+        if os.path.exists(partial_file):
+            os.remove(partial_file)
+    if os.path.abspath(output_file) != os.path.abspath(source):
+        os.remove(source)
+
+    output_relative = os.path.relpath(output_file, folder)
+    checksum, cached = media_checksum(folder, {'file': output_relative})
+    changes = {
+        'final': dict(cached, file=output_relative, profile=profile, codec_args=ENCODE_PROFILES[profile]['args'],
+                      proxy=None, pending=False, error=None, fingerprint=None),
+        'storage': {'tier': 'archived', 'archived': stamp, 'archived_from': final_profile(final)},
+    }
+    action = f"archived as {profile} ({format_size(size)} -> {format_size(archived_size)})"
+    return changes, [action], size - archived_size, size + archived_size
+
+def rest(seconds, should_stop=None):
+    """Sleep in short steps so a stop request (shutdown, a recording starting) isn't kept waiting"""
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        if should_stop and should_stop():
+            return
+        time.sleep(min(0.5, deadline - time.monotonic()))
+
+def sweep(catalog, policy, urgent=False, dry_run=False, should_stop=None):
+    """Apply the policy to the catalogued recordings, oldest first. Under disk pressure (urgent) trimming
+    ignores ages until free space is back above the watermark. Yields (recording id, actions, bytes
+    freed, error) for each recording that was changed or failed."""
+    now = time.time()
+    projected_free = free_bytes(catalog.base_dir)
+    for row in reversed(catalog.query(limit=-1)):
+        if should_stop and should_stop():
+            return
+        folder = os.path.join(catalog.base_dir, row['id'])
+        actions = []
+        freed = io_bytes = 0
+        started = time.monotonic()
+        error = None
+        try:
+            manifest = read_manifest(folder)
+            if manifest is None:
+                continue
+            age = recording_age_days(manifest, now)
+            if not dry_run:
+                projected_free = free_bytes(catalog.base_dir)
+            short_of_space = urgent and projected_free < policy.min_free_bytes
+            trim_due = policy.keep_intermediates_days is not None and age is not None \
+                and age >= policy.keep_intermediates_days
+            # Archiving needs room for a second copy while it encodes, so it waits out disk pressure
+            archive_due = policy.archive_after_days is not None and age is not None \
+                and age >= policy.archive_after_days and not short_of_space
+            # Audio still being transcribed keeps its intermediates; final_complete() covers running encodes
+            busy = manifest.get('transcription', {}).get('status') == 'pending'
+            if trim_due or short_of_space or archive_due:
+                manifest, io_bytes = record_final_checksum(catalog, folder, manifest, dry_run)
+
+            steps = []
+            if (trim_due or short_of_space) and not busy and final_complete(folder, manifest) \
+                    and needs_trim(folder, manifest, policy):
+                steps.append(trim)
+            if archive_due and needs_archive(folder, manifest, policy):
+                steps.append(archive)
+            for step in steps:
+                changes, step_actions, step_freed, step_io = step(folder, manifest, policy, dry_run)
+                if changes and not dry_run:
+                    manifest = catalog.update(folder, changes)
+                actions += step_actions
+                freed += step_freed
+                io_bytes += step_io
+        except Exception as e:
+            logger.error(f"Retention sweep of {folder} failed: {e}")
+            error = str(e)
+
+        if actions or error:
+            projected_free += freed
+            yield row['id'], actions, freed, error
+        if io_bytes and policy.io_rate:
+            # Pace to the average rate: rest until this recording's I/O fits the budget
+            rest(io_bytes / policy.io_rate - (time.monotonic() - started), should_stop)
+
+def main():
+    defaults = RetentionPolicy.from_env()
+    parser = argparse.ArgumentParser(description="Apply retention policies to saved recordings")
+    parser.add_argument('recordings_dir', nargs='?', default='recordings')
+    parser.add_argument('--keep-intermediates', type=float, default=defaults.keep_intermediates_days,
+                        metavar='DAYS', help="delete video/ and compress audio/ after this many days")
+    parser.add_argument('--final-only', action='store_true', default=defaults.final_only,
+                        help="delete the audio too instead of keeping it as FLAC")
+    parser.add_argument('--archive-after', type=float, default=defaults.archive_after_days, metavar='DAYS',
+                        help="re-encode copy/fast finals with the archive profile after this many days")
+    parser.add_argument('--archive-profile', choices=list(ENCODE_PROFILES), default=defaults.archive_profile)
+    parser.add_argument('--min-free-gb', type=float, default=defaults.min_free_bytes / 2**30,
+                        help="below this free space, trim the oldest recordings regardless of age")
+    parser.add_argument('--io-rate', type=float, default=defaults.io_rate / 2**20, metavar='MB_PER_S',
+                        help="average read plus write rate (0 = unpaced)")
+    parser.add_argument('--dry-run', action='store_true', help="show what would be done")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    policy = RetentionPolicy(args.keep_intermediates, args.final_only, args.archive_after, args.archive_profile,
+                             args.min_free_gb * 2**30, args.io_rate * 2**20)
+    catalog = RecordingCatalog(args.recordings_dir)
+    catalog.sync()
+
+    urgent = disk_space_low(args.recordings_dir, policy)
+    if urgent:
+        print(f"Only {format_size(free_bytes(args.recordings_dir))} free: trimming oldest recordings first")
+    changed = failed = freed_total = 0
+    started = time.time()
+    try:
+        for recording_id, actions, freed, error in sweep(catalog, policy, urgent, args.dry_run):
+            if error:
+                failed += 1
+                print(f"{recording_id}: failed: {error}")
+            else:
+                changed += 1
+                freed_total += freed
+                print(f"{recording_id}: {', '.join(actions)}")
+    except KeyboardInterrupt:
+        print("Interrupted; finished recordings are recorded in their manifests")
+        raise SystemExit(130)
+
+    verb = "would change" if args.dry_run else "changed"
+    print(f"{changed} recordings {verb}, {format_size(freed_total)} freed, {failed} failed "
+          f"in {time.time() - started:.1f}s")
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import threading
+
+import pytest
+
+from record import CameraTuner
+
+# Bytes per JPEG at each ladder step, heaviest first
+FRAME_BYTES = [40000, 30000, 22000, 15000, 12000, 8000, 6000, 4000, 2000]
+
+class Response:
+    def raise_for_status(self):
+        pass
+
+class Session:
+    """Stands in for the camera's /control endpoint, recording every change it is asked for"""
+
+    def __init__(self, gate=None):
+        self.requests = []
+        self.gate = gate
+
+    def get(self, url, params=None, timeout=None):
+        if self.gate:
+            self.gate.wait(5)
+        self.requests.append((params['framesize'], params['quality']))
+        return Response()
+
+def tuner(allow_resize=lambda: True, session=None):
+    return CameraTuner(None, "http://camera/control", 20, allow_resize, session=session or Session())
+
+def run_link(tuner, windows, bandwidth=None, max_fps=25):
+    """Feed the tuner what a link of the given byte rate and a sensor of the given frame rate would
+    deliver at its current step; returns the steps it went through"""
+    steps = []
+    for _ in range(windows):
+        frame = FRAME_BYTES[tuner.step]
+        fps = min(max_fps, bandwidth / frame) if bandwidth else max_fps
+        tuner.adjust(fps, fps * frame)
+        steps.append(tuner.step)
+    return steps
+
+def test_slow_link_settles_on_the_heaviest_step_that_fits():
+    camera = tuner()
+    steps = run_link(camera, 15, bandwidth=300 * 1024)
+    # 15000-byte frames are the largest that make 20 FPS through 300 KB/s
+    assert steps[:2] == [2, 3]
+    assert min(steps[2:]) == max(steps[2:]) == 3
+    assert camera.mode == "VGA q22"
+
+def test_steps_back_up_when_the_link_recovers():
+    camera = tuner()
+    run_link(camera, 5, bandwidth=300 * 1024)
+    # The ceiling from the slow link is probed upwards 2% a window, so this takes a while
+    steps = run_link(camera, 80, bandwidth=2000 * 1024)
+    assert steps[-1] == 0
+    assert steps == sorted(steps, reverse=True)
+
+def test_camera_bound_rate_is_not_blamed_on_the_link():
+    camera = tuner()
+    steps = run_link(camera, 6, max_fps=12)
+    # Stepping down sent less data but no more frames, so it goes back and aims at 12 FPS instead
+    assert steps[:2] == [2, 1]
+    assert camera.camera_limit == 12
+    assert steps[-1] == 0
+
+def test_frame_size_stays_fixed_while_recording():
+    recording = True
+    session = Session()
+    camera = tuner(allow_resize=lambda: not recording, session=session)
+    camera.step = 3  # VGA q22, the lightest VGA step
+    camera.adjust(5, 5 * FRAME_BYTES[3])
+    assert camera.step == 3 and session.requests == []
+    assert camera.apply(4) is False
+
+def test_recording_start_waits_for_a_resize_in_flight():
+    recording = False
+    gate = threading.Event()
+    camera = tuner(allow_resize=lambda: not recording, session=Session(gate))
+    resize = threading.Thread(target=camera.apply, args=(4,))
+    resize.start()
+    while not camera.control_lock.locked():
+        pass
+
+    recording = True
+    held = threading.Thread(target=camera.hold_frame_size)
+    held.start()
+    held.join(0.2)
+    assert held.is_alive()
+    gate.set()
+    held.join(5)
+    resize.join(5)
+    assert not held.is_alive()
+    # The resize that was already sent finished before recording began; later ones are refused
+    assert camera.LADDER[camera.step][0] == "CIF"
+    assert camera.apply(6) is False
+
+@pytest.mark.parametrize("step", range(len(CameraTuner.LADDER)))
+def test_next_step_stays_on_the_ladder(step):
+    camera = tuner()
+    camera.step = step
+    lighter, heavier = camera.next_step(1), camera.next_step(-1)
+    assert lighter == (step + 1 if step + 1 < len(camera.LADDER) else None)
+    assert heavier == (step - 1 if step > 0 else None)
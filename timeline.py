@@ -0,0 +1,182 @@
+"""Precomputed timelines for scrubbing long recordings without decoding the media.
+
+Waveform peaks are min/max pairs per block of samples at several zoom levels, written in
+audiowaveform's binary .dat format (version 1, 8-bit), which waveform viewers such as
+peaks.js load directly. Thumbnails are tiled into JPEG sprite sheets indexed by a WebVTT
+file (`sprite_000.jpg#xywh=x,y,w,h` cues), the format web players use for seek previews.
+
+Both are built incrementally from the samples and frames as they are captured, so
+finalizing a recording only writes them out.
+"""
+import os
+import struct
+import wave
+
+import cv2
+import numpy as np
+
+PEAK_LEVELS = (256, 1024, 4096, 16384)  # Samples per peak; 256 at 16 kHz is 62.5 peaks per second
+THUMBNAIL_INTERVAL = 1.0  # Seconds between thumbnails
+THUMBNAIL_WIDTH = 160
+SPRITE_COLUMNS = 10
+SPRITE_ROWS = 10
+SPRITE_QUALITY = 70
+TIMELINE_DIR = "timeline"
+THUMBNAILS_INDEX = "thumbnails.vtt"
+
+class WaveformPeaks:
+    """Running min/max of 8-bit unsigned samples per block, at several resolutions"""
+
+    def __init__(self, sample_rate, levels=PEAK_LEVELS):
+        self.sample_rate = sample_rate
+        self.levels = levels
+        self.pending = bytearray()  # Samples that don't fill a block yet
+        self.mins = []
+        self.maxs = []
+
+    def add(self, data):
+        self.pending += data
+        block = self.levels[0]
+        whole = len(self.pending) // block * block
+        if whole:
+            # audiowaveform stores signed 8-bit values: recentre the unsigned samples on zero
+            samples = (np.frombuffer(bytes(self.pending[:whole]), dtype=np.uint8).astype(np.int16) - 128)
+            samples = samples.reshape(-1, block)
+            self.mins.append(samples.min(axis=1).astype(np.int8))
+            self.maxs.append(samples.max(axis=1).astype(np.int8))
+            del self.pending[:whole]
+
+    def peaks(self):
+        """(samples per peak, mins, maxs) for each level, including the last partial block"""
+        mins, maxs = list(self.mins), list(self.maxs)
+        if self.pending:
+            tail = np.frombuffer(bytes(self.pending), dtype=np.uint8).astype(np.int16) - 128
+            mins.append(np.array([tail.min()], dtype=np.int8))
+            maxs.append(np.array([tail.max()], dtype=np.int8))
+        mins = np.concatenate(mins) if mins else np.zeros(0, dtype=np.int8)
+        maxs = np.concatenate(maxs) if maxs else np.zeros(0, dtype=np.int8)
+
+        for level in self.levels:
+            factor = level // self.levels[0]
+            if factor > 1 and len(mins):
+                starts = np.arange(0, len(mins), factor)
+                yield level, np.minimum.reduceat(mins, starts), np.maximum.reduceat(maxs, starts)
+            else:
+                yield level, mins, maxs
+
+    def save(self, directory):
+        """Write peaks_<samples per peak>.dat for every level; returns the file names"""
+        os.makedirs(directory, exist_ok=True)
+        names = []
+        for level, mins, maxs in self.peaks():
+            name = f"peaks_{level}.dat"
+            pairs = np.empty(len(mins) * 2, dtype=np.int8)
+            pairs[0::2], pairs[1::2] = mins, maxs
+            with open(os.path.join(directory, name), 'wb') as f:
+                # version, flags (1 = 8-bit), sample rate, samples per pixel, length
+                f.write(struct.pack('<iIiiI', 1, 1, self.sample_rate, level, len(mins)))
+                f.write(pairs.tobytes())
+            names.append(name)
+        return names
+
+class ThumbnailSprites:
+    """One small thumbnail per interval, tiled into sprite sheets as frames arrive"""
+
+    def __init__(self, interval=THUMBNAIL_INTERVAL, width=THUMBNAIL_WIDTH):
+        self.interval = interval
+        self.width = width
+        self.height = None
+        self.origin = None  # Timestamp of the first frame, time zero of the final video
+        self.next_time = 0.0
+        self.previous = None
+        self.cached = (None, None)  # Last frame resized and its thumbnail
+        self.sheet = None
+        self.sheets = []  # Finished sheets, JPEG-encoded to keep long recordings small in memory
+        self.cues = []  # (start, sheet index, x, y)
+
+    def add(self, frame, timestamp):
+        if self.origin is None:
+            self.origin = timestamp
+            height, width = frame.shape[:2]
+            self.height = max(2, round(self.width * height / width / 2) * 2)
+        elapsed = timestamp - self.origin
+
+        # A frame held across several intervals (static scene) fills each of them
+        while elapsed >= self.next_time:
+            source = self.previous if self.previous is not None and elapsed > self.next_time else frame
+            self.add_tile(source, self.next_time)
+            self.next_time += self.interval
+        self.previous = frame
+
+    def add_tile(self, frame, start):
+        if self.cached[0] is frame:
+            thumbnail = self.cached[1]
+        else:
+            thumbnail = cv2.resize(frame, (self.width, self.height), interpolation=cv2.INTER_AREA)
+            self.cached = (frame, thumbnail)
+
+        per_sheet = SPRITE_COLUMNS * SPRITE_ROWS
+        index = len(self.cues) % per_sheet
+        if index == 0:
+            self.finish_sheet()
+            self.sheet = np.zeros((self.height * SPRITE_ROWS, self.width * SPRITE_COLUMNS, 3), dtype=np.uint8)
+        x, y = index % SPRITE_COLUMNS * self.width, index // SPRITE_COLUMNS * self.height
+        self.sheet[y:y + self.height, x:x + self.width] = thumbnail
+        self.cues.append((start, len(self.sheets), x, y))
+
+    def finish_sheet(self):
+        if self.sheet is None:
+            return
+        # Crop the unused rows of a partly filled last sheet
+        rows = -(-(len(self.cues) - len(self.sheets) * SPRITE_COLUMNS * SPRITE_ROWS) // SPRITE_COLUMNS)
+        ok, jpeg = cv2.imencode('.jpg', self.sheet[:rows * self.height], [cv2.IMWRITE_JPEG_QUALITY, SPRITE_QUALITY])
+        self.sheets.append(jpeg.tobytes())
+        self.sheet = None
+
+    def save(self, directory, duration=None):
+        """Write sprite_NNN.jpg sheets and the WebVTT index; returns the index file name or None"""
+        if not self.cues:
+            return None
+        self.finish_sheet()
+        os.makedirs(directory, exist_ok=True)
+        for number, jpeg in enumerate(self.sheets):
+            with open(os.path.join(directory, f"sprite_{number:03d}.jpg"), 'wb') as f:
+                f.write(jpeg)
+
+        end_of_last = max(duration or 0.0, self.cues[-1][0] + self.interval)
+        with open(os.path.join(directory, THUMBNAILS_INDEX), 'w', encoding='utf-8') as f:
+            f.write("WEBVTT\n")
+            for i, (start, sheet, x, y) in enumerate(self.cues):
+                end = self.cues[i + 1][0] if i + 1 < len(self.cues) else end_of_last
+                f.write(f"\n{vtt_time(start)} --> {vtt_time(end)}\n"
+                        f"sprite_{sheet:03d}.jpg#xywh={x},{y},{self.width},{self.height}\n")
+        return THUMBNAILS_INDEX
+
+def vtt_time(seconds):
+    milliseconds = round(seconds * 1000)
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    return f"{hours:02d}:{minutes:02d}:{milliseconds / 1000:06.3f}"
+
+def timeline_from_files(audio_file, video_file, directory, interval=THUMBNAIL_INTERVAL):
+    """Build the timeline of an existing recording from its saved WAV and video (decodes both once)"""
+    with wave.open(audio_file, 'rb') as wav:
+        peaks = WaveformPeaks(wav.getframerate())
+        while True:
+            data = wav.readframes(65536)
+            if not data:
+                break
+            peaks.add(data)
+
+    sprites = ThumbnailSprites(interval)
+    capture = cv2.VideoCapture(video_file)
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            sprites.add(frame, capture.get(cv2.CAP_PROP_POS_MSEC) / 1000.0)
+    finally:
+        capture.release()
+
+    return {'peaks': peaks.save(directory), 'thumbnails': sprites.save(directory), 'thumbnail_interval': interval}
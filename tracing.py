@@ -0,0 +1,96 @@
+"""Opt-in span tracing exported as Chrome trace JSON (open in https://ui.perfetto.dev or chrome://tracing).
+
+    with tracer.span("save video", frames=len(frames)):
+        ...
+
+While the tracer is stopped a span costs one method call returning a shared no-op
+context manager, so instrumentation can stay in the capture loops. Timestamps are
+wall-clock microseconds, so traces written by the recorder and by the transcription
+server on the same machine line up when loaded together.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+EPOCH_OFFSET = time.time() - time.perf_counter()  # perf_counter precision, wall-clock origin
+NO_SPAN = nullcontext()
+
+def now_us():
+    return (time.perf_counter() + EPOCH_OFFSET) * 1e6
+
+class Span:
+    __slots__ = ('tracer', 'name', 'args', 'threshold', 'started')
+
+    def __init__(self, tracer, name, args, threshold):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.threshold = threshold
+
+    def __enter__(self):
+        self.started = now_us()
+        return self
+
+    def __exit__(self, *exc):
+        duration = now_us() - self.started
+        if duration >= self.threshold:
+            self.tracer.add(self.name, self.started, duration, self.args)
+        return False
+
+class Tracer:
+    """Collects complete ("X"), counter ("C") and thread name events between start() and stop()"""
+
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.thread_names = {}
+
+    def start(self):
+        self.events = []
+        self.thread_names = {}
+        self.enabled = True
+
+    def span(self, name, threshold_ms=0, **args):
+        """Time a block; spans shorter than threshold_ms are dropped (for per-block hot paths)"""
+        if not self.enabled:
+            return NO_SPAN
+        return Span(self, name, args, threshold_ms * 1000)
+
+    def complete(self, name, started_us, **args):
+        """Record a span that began at started_us (from now_us()) and ends now, e.g. a queue wait"""
+        if self.enabled:
+            self.add(name, started_us, now_us() - started_us, args)
+
+    def counter(self, name, **values):
+        if self.enabled:
+            self.events.append({'name': name, 'ph': 'C', 'ts': now_us(), 'pid': os.getpid(), 'args': values})
+
+    def add(self, name, started_us, duration_us, args):
+        thread = threading.current_thread()
+        # list.append and dict assignment are atomic, so capture threads don't need a lock here
+        self.thread_names[thread.ident] = thread.name
+        event = {'name': name, 'ph': 'X', 'ts': started_us, 'dur': duration_us,
+                 'pid': os.getpid(), 'tid': thread.ident}
+        if args:
+            event['args'] = args
+        self.events.append(event)
+
+    def stop(self, path=None):
+        """Stop collecting and write the trace to path (if given); returns the number of events"""
+        self.enabled = False
+        events, self.events = self.events, []
+        if path and events:
+            write_trace(path, events, self.thread_names)
+        return len(events)
+
+def write_trace(path, events, thread_names=None):
+    metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid, 'args': {'name': name}}
+                for tid, name in (thread_names or {}).items()]
+    temp_path = path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': metadata + events, 'displayTimeUnit': 'ms'}, f)
+    os.replace(temp_path, path)
+
+tracer = Tracer()
@@ -1,20 +1,356 @@
 import os
-from fastapi import FastAPI, File, UploadFile
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, File, Form, Request, UploadFile
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from vosk import Model, KaldiRecognizer
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict
+from contextlib import closing, contextmanager
+from typing import List
+import urllib.request
+import socketserver
+import socket
+import struct
+import multiprocessing
+import threading
+import logging
+import sqlite3
+import numpy as np
+import asyncio
 import wave
 import subprocess
+import shutil
+import stat
 import uuid 
 import json
+import time
 
 app = FastAPI()
+logger = logging.getLogger(__name__)
 
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 # Get model path from env or default
 MODEL_PATH = os.getenv("VOSK_MODEL_PATH", "models/vosk-model-small-en-us-0.15")
-model = Model(MODEL_PATH)
+
+# Models are loaded lazily by name and evicted least-recently-used past the memory budget.
+# MODEL_PATH is the "default" model, every directory in VOSK_MODELS_DIR is available by
+# its name, and VOSK_MODELS adds aliases, e.g. "small=models/a,large=models/b".
+MODELS_DIR = os.getenv("VOSK_MODELS_DIR", "models")
+DEFAULT_MODEL = os.getenv("VOSK_DEFAULT_MODEL", "default")
+def default_model_memory_mb():
+    """Half of the memory this process may use: physical RAM, or the cgroup limit in a container.
+    0 (no limit) where neither can be read."""
+    try:
+        total = os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return 0.0
+    try:
+        with open("/sys/fs/cgroup/memory.max") as f:
+            limit = f.read().strip()
+        if limit.isdigit():
+            total = min(total, int(limit))
+    except OSError:
+        pass
+    return total / 2 / 1024 / 1024
+
+MODEL_MEMORY_MB = float(os.getenv("MODEL_MEMORY_MB") or default_model_memory_mb())  # 0 = no limit
+MODEL_ALIASES = dict(
+    (name.strip(), path.strip())
+    for name, path in (alias.split("=", 1) for alias in os.getenv("VOSK_MODELS", "").split(",") if "=" in alias)
+)
+loaded_models = OrderedDict()  # name -> (Model, estimated bytes), least recently used first
+model_load_locks = {}
+models_lock = threading.Lock()
+
+# All transcription work (single, batch and job requests) runs on one pool of worker
+# threads. Every worker builds its own recognizer on the shared model; Vosk releases the
+# GIL while decoding, so the threads spread over all cores. BATCH_WORKERS is the old name.
+TRANSCRIBE_WORKERS = int(os.getenv("TRANSCRIBE_WORKERS", os.getenv("BATCH_WORKERS", os.cpu_count() or 1)))
+# Work is picked by priority class, then the least served client, then the shortest
+# expected job. A job's expected cost shrinks by AGING_RATE seconds per second waited.
+PRIORITY_CLASSES = {"high": 0, "normal": 1, "low": 2}
+AGING_RATE = float(os.getenv("SCHEDULER_AGING_RATE", "1.0"))
+expected_rtf = 0.5           # Running estimate of decode time per audio second
+# Server-side paths given to /transcribe/batch must live under this directory
+BATCH_INPUT_DIR = os.path.abspath(os.getenv("BATCH_INPUT_DIR", "recordings"))
+
+# Long recordings are split at silence gaps and the segments decoded by worker processes.
+# Each worker holds its own copy of the model, so the pool serves one model at a time and
+# only gets as many workers as fit the memory budget next to the models loaded here.
+PARALLEL_MIN_SECONDS = float(os.getenv("PARALLEL_MIN_SECONDS", "120"))
+SEGMENT_TARGET_SECONDS = float(os.getenv("SEGMENT_TARGET_SECONDS", "30"))
+SEGMENT_WORKERS = int(os.getenv("SEGMENT_WORKERS", min(4, os.cpu_count() or 1)))
+SILENCE_MIN_SECONDS = 0.3    # Shortest gap that counts as a split point
+SILENCE_RMS_FLOOR = 200      # 16-bit RMS below which a 10ms window is always silent
+READ_FRAMES = 4000           # Frames fed to the recognizer per call
+segment_pool = None  # {"executor", "model", "workers", "bytes"}; guarded by models_lock
+model_sizes = {}  # path -> estimated bytes
+
+# Asynchronous jobs live in SQLite so queued work survives a server restart
+JOBS_DB = os.path.join(UPLOAD_DIR, "jobs.db")
+CALLBACK_RETRIES = 3
+# Webhooks are sent from their own threads, so a slow or dead callback URL never holds a transcription worker
+callback_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="callback")
+job_progress = {}  # job id -> progress and partial transcript while the job runs
+
+# Progress streaming (stream=ndjson or stream=sse on /transcribe/)
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+STREAM_HEARTBEAT_SECONDS = 10  # Keeps client read timeouts from firing while queued
+
+# Resumable uploads: the client creates an upload, then PUTs chunks at increasing offsets.
+# The partial file on disk is the only state, so an upload resumes even after a restart.
+MAX_UPLOAD_CHUNK = 16 * 1024 * 1024
+upload_locks = {}  # upload id -> asyncio.Lock; one chunk is written at a time, e.g. when a client retries
+
+# Retention of uploads/: inputs, converted WAVs and transcripts older than UPLOAD_RETENTION_HOURS are
+# deleted unless a queued or running job still needs them (job results stay in jobs.db). Below
+# MIN_FREE_DISK_MB the sweeper deletes finished work early, oldest first, and new uploads get 507
+# so the space left goes to the jobs already accepted. Both are off (0) unless configured.
+UPLOAD_RETENTION_HOURS = float(os.getenv("UPLOAD_RETENTION_HOURS", "0"))
+MIN_FREE_DISK_MB = float(os.getenv("MIN_FREE_DISK_MB", "0"))
+SWEEP_INTERVAL = float(os.getenv("UPLOAD_SWEEP_INTERVAL", "600"))
+sweep_requested = threading.Event()
+
+# Local transport for a recorder on the same machine: PCM blocks stream over a Unix socket
+# straight into a recognizer, with no upload, no files and no ffmpeg pass. Empty = disabled.
+# The socket is created owner-only, so keep it in a directory other users cannot write to,
+# e.g. $XDG_RUNTIME_DIR/vosk-transcriber.sock.
+LOCAL_SOCKET_PATH = os.getenv("LOCAL_SOCKET_PATH", "")
+
+# Opt-in Chrome/Perfetto trace of each transcription, written to TRACE_DIR/<id>.json. Timestamps are
+# wall-clock microseconds, so the recorder's trace.json of the same session lines up with it.
+TRACE_DIR = os.getenv("TRACE_DIR")
+EPOCH_OFFSET = time.time() - time.perf_counter()
+job_trace = threading.local()  # .events: trace of the job running on this thread, None when not tracing
+
+# Metrics kept in process and served at /metrics in Prometheus text format
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+DURATION_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 7200)
+RTF_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 5)
+METRICS = {
+    "transcriber_stage_seconds": ("histogram", "Time spent in each processing stage", LATENCY_BUCKETS),
+    "transcriber_audio_duration_seconds": ("histogram", "Duration of transcribed audio", DURATION_BUCKETS),
+    "transcriber_real_time_factor": ("histogram", "Decode time divided by audio duration", RTF_BUCKETS),
+    "transcriber_model_load_seconds": ("histogram", "Time taken to load a model", LATENCY_BUCKETS),
+    "transcriber_requests_total": ("counter", "Transcriptions by endpoint and outcome", None),
+    "transcriber_model_evictions_total": ("counter", "Models evicted to stay within the memory budget", None),
+    "transcriber_swept_bytes_total": ("counter", "Bytes deleted from uploads/ by the retention sweeper", None),
+    "transcriber_in_flight": ("gauge", "Transcriptions currently being processed", None),
+    "transcriber_queued": ("gauge", "Transcriptions waiting for a worker", None),
+    "transcriber_models_loaded": ("gauge", "Models currently loaded", None),
+    "transcriber_model_memory_bytes": ("gauge", "Estimated memory of loaded models, segment worker copies included", None),
+    "transcriber_segment_workers": ("gauge", "Segment worker processes, each holding a copy of the model", None),
+    "transcriber_disk_free_bytes": ("gauge", "Free space on the uploads/ disk at the last sweep", None),
+}
+metric_values = {name: {} for name in METRICS}
+metrics_lock = threading.Lock()
+
+def metric_key(labels):
+    return tuple(sorted(labels.items()))
+
+def observe(name, value, **labels):
+    """Add one observation to a histogram"""
+    buckets = METRICS[name][2]
+    with metrics_lock:
+        entry = metric_values[name].setdefault(metric_key(labels), [[0] * len(buckets), 0.0, 0])
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                entry[0][i] += 1
+        entry[1] += value
+        entry[2] += 1
+
+def inc(name, amount=1, **labels):
+    """Add to a counter or gauge"""
+    key = metric_key(labels)
+    with metrics_lock:
+        metric_values[name][key] = metric_values[name].get(key, 0) + amount
+
+def set_gauge(name, value, **labels):
+    with metrics_lock:
+        metric_values[name][metric_key(labels)] = value
+
+def trace_span(name, started, elapsed, **args):
+    """Add a span (perf_counter start, seconds) to this thread's job trace, if one is being recorded"""
+    events = getattr(job_trace, "events", None)
+    if events is not None:
+        events.append({"name": name, "ph": "X", "ts": (started + EPOCH_OFFSET) * 1e6, "dur": elapsed * 1e6,
+                       "pid": os.getpid(), "tid": threading.get_ident(), "args": args})
+
+@contextmanager
+def traced(name, **args):
+    """Trace-only span, for steps too fine-grained to be metrics stages"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace_span(name, started, time.perf_counter() - started, **args)
+
+@contextmanager
+def timed(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        observe("transcriber_stage_seconds", elapsed, stage=stage)
+        trace_span(stage, started, elapsed)
+
+class UploadTimingMiddleware:
+    """Times each request body from the request's start to its last byte as the "upload" stage.
+    Starlette spools multipart files before a handler runs, so the handlers can't time the transfer."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        received = 0
+
+        async def timed_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received and not message.get("more_body"):
+                    observe("transcriber_stage_seconds", time.perf_counter() - started, stage="upload")
+            return message
+
+        await self.app(scope, timed_receive, send)
+
+app.add_middleware(UploadTimingMiddleware)
+
+def write_trace(audio_id, events):
+    metadata = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": name}}
+                for pid, name in {event["pid"]: "segment worker" for event in events}.items()
+                if pid != os.getpid()]
+    metadata.append({"name": "process_name", "ph": "M", "pid": os.getpid(), "args": {"name": "transcriber"}})
+    os.makedirs(TRACE_DIR, exist_ok=True)
+    path = os.path.join(TRACE_DIR, f"{audio_id}.json")
+    with open(path, "w") as f:
+        json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, f)
+    logger.info(f"Trace written: {path} ({len(events)} events)")
+
+@contextmanager
+def in_flight():
+    inc("transcriber_in_flight")
+    try:
+        yield
+    finally:
+        inc("transcriber_in_flight", -1)
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{escape_label(v)}"' for k, v in pairs) + "}"
+
+def render_metrics():
+    lines = []
+    with metrics_lock:
+        for name, (kind, help_text, buckets) in METRICS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, value in sorted(metric_values[name].items()):
+                if kind != "histogram":
+                    lines.append(f"{name}{format_labels(key)} {value}")
+                    continue
+                counts, total, count = value
+                for bound, bucket_count in zip(buckets, counts):
+                    lines.append(f"{name}_bucket{format_labels(key, [('le', bound)])} {bucket_count}")
+                lines.append(f"{name}_bucket{format_labels(key, [('le', '+Inf')])} {count}")
+                lines.append(f"{name}_sum{format_labels(key)} {total}")
+                lines.append(f"{name}_count{format_labels(key)} {count}")
+    return "\n".join(lines) + "\n"
+
+def model_paths():
+    """All model names that can be requested, mapped to their directories"""
+    paths = {}
+    if os.path.isdir(MODELS_DIR):
+        for name in sorted(os.listdir(MODELS_DIR)):
+            if os.path.isdir(os.path.join(MODELS_DIR, name)):
+                paths[name] = os.path.join(MODELS_DIR, name)
+    paths.update(MODEL_ALIASES)
+    paths["default"] = MODEL_PATH
+    return paths
+
+def model_size(path):
+    # Size on disk is a close enough estimate of the memory a loaded model takes
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+def model_bytes(name):
+    path = model_paths()[name]
+    if path not in model_sizes:
+        model_sizes[path] = model_size(path)
+    return model_sizes[path]
+
+def model_memory():
+    """Estimated bytes of the models held here and by the segment workers; call with models_lock held"""
+    loaded = sum(size for _, size in loaded_models.values())
+    return loaded + (segment_pool["workers"] * segment_pool["bytes"] if segment_pool else 0)
+
+def evict_models(needed):
+    """Drop least recently used models until needed more bytes fit the budget, then the segment
+    workers' copies if that isn't enough; call with models_lock held"""
+    if MODEL_MEMORY_MB <= 0:
+        return
+    budget = MODEL_MEMORY_MB * 1024 * 1024
+    while model_memory() + needed > budget:
+        if loaded_models:
+            # Recognizers still decoding keep their model alive until they finish
+            name, _ = loaded_models.popitem(last=False)
+            inc("transcriber_model_evictions_total")
+            logger.info(f"Evicted model {name}")
+        elif segment_pool:
+            retire_segment_pool()
+            inc("transcriber_model_evictions_total")
+        else:
+            break
+
+def get_model(name=None):
+    """Return a loaded model by name, loading it on first use"""
+    name = name or DEFAULT_MODEL
+    with models_lock:
+        if name in loaded_models:
+            loaded_models.move_to_end(name)
+            return loaded_models[name][0]
+        path = model_paths().get(name)
+        if path is None:
+            raise ValueError(f"Unknown model: {name}")
+        load_lock = model_load_locks.setdefault(name, threading.Lock())
+
+    # Only one thread loads a given model; the rest wait and reuse it
+    with load_lock:
+        with models_lock:
+            if name in loaded_models:
+                loaded_models.move_to_end(name)
+                return loaded_models[name][0]
+        size = model_size(path)
+        with models_lock:
+            evict_models(size)
+        started = time.perf_counter()
+        loaded = Model(path)
+        load_seconds = time.perf_counter() - started
+        observe("transcriber_model_load_seconds", load_seconds, model=name)
+        logger.info(f"Loaded model {name} from {path} in {load_seconds:.1f}s")
+        with models_lock:
+            loaded_models[name] = (loaded, size)
+    return loaded
+
+def unknown_model_error(model_name):
+    if model_name and model_name not in model_paths():
+        return JSONResponse(status_code=400, content={"error": f"Unknown model: {model_name}"})
+    return None
 
 def convert_to_wav(input_path, output_path):
     subprocess.run([
@@ -24,40 +360,1006 @@ def convert_to_wav(input_path, output_path):
         "-y"
     ], check=True)
 
-def transcribe(wav_path):
-    wf = wave.open(wav_path, "rb")
-    rec = KaldiRecognizer(model, wf.getframerate())
-    result_text = ""
+def collect_result(result, offset, texts, words):
+    """Append the text and offset-shifted word timings of one recognizer result;
+    returns the new text and words"""
+    result = json.loads(result)
+    if result.get('text'):
+        texts.append(result['text'])
+    new_words = result.get('result', [])
+    for word in new_words:
+        word['start'] = round(word['start'] + offset, 3)
+        word['end'] = round(word['end'] + offset, 3)
+        words.append(word)
+    return result.get('text', ''), new_words
 
-    while True:
-        data = wf.readframes(4000)
-        if len(data) == 0:
-            break
-        if rec.AcceptWaveform(data):
-            result_text += json.loads(rec.Result())['text'] + " "
-    result_text += json.loads(rec.FinalResult())['text']
-    return result_text.strip()
+def decode_segment(pcm, rate, offset, model_name=None, on_result=None, trace=False):
+    """Decode one block of 16-bit mono PCM; word times are shifted by offset seconds.
+    on_result(text, words, position) is called for every intermediate result.
+    With trace set (in a segment worker process), the segment's trace events are returned under "trace"."""
+    if trace:
+        job_trace.events = []
+    started = time.perf_counter()
+    with traced("load model"):
+        rec = KaldiRecognizer(get_model(model_name), rate)
+    rec.SetWords(True)
+    texts = []
+    words = []
+
+    step = READ_FRAMES * 2
+    for i in range(0, len(pcm), step):
+        if rec.AcceptWaveform(pcm[i:i + step]):
+            text, new_words = collect_result(rec.Result(), offset, texts, words)
+            if on_result:
+                on_result(text, new_words, offset + min(i + step, len(pcm)) / 2 / rate)
+    with traced("final result"):
+        text, new_words = collect_result(rec.FinalResult(), offset, texts, words)
+    if on_result:
+        on_result(text, new_words, offset + len(pcm) / 2 / rate)
+    segment = {
+        "start": round(offset, 3),
+        "end": round(offset + len(pcm) / 2 / rate, 3),
+        "text": " ".join(texts),
+        "words": words,
+    }
+    trace_span("decode segment", started, time.perf_counter() - started, start=segment["start"], end=segment["end"])
+    if trace:
+        segment["trace"], job_trace.events = job_trace.events, None
+    return segment
+
+def find_split_points(samples, rate):
+    """Return sample indices to cut at, placed in the middle of silence gaps"""
+    window = rate // 100
+    count = len(samples) // window
+    if count == 0:
+        return []
+    frames = samples[:count * window].astype(np.float32).reshape(count, window)
+    rms = np.sqrt((frames ** 2).mean(axis=1))
+    # Silence is anything 20dB below the loud parts of the recording
+    threshold = max(SILENCE_RMS_FLOOR, float(np.percentile(rms, 90)) * 0.1)
+
+    # Start/end window index of each silent run
+    silent = np.concatenate(([0], (rms < threshold).astype(np.int8), [0]))
+    edges = np.flatnonzero(np.diff(silent))
+    runs = edges.reshape(-1, 2)
+    min_run = int(SILENCE_MIN_SECONDS * 100)
+    midpoints = [int(a + b) // 2 for a, b in runs if b - a >= min_run]
+
+    # Cut at the first gap past the target length; force a cut if no gap shows up
+    target = int(SEGMENT_TARGET_SECONDS * 100)
+    longest = target * 2
+    cuts = []
+    start = 0
+    for mid in midpoints + [count]:
+        while mid - start > longest:
+            start += longest
+            cuts.append(start)
+        if mid - start >= target and mid < count - min_run:
+            cuts.append(mid)
+            start = mid
+    return [cut * window for cut in cuts]
+
+def retire_segment_pool():
+    """Let the segment workers finish what they were given, then exit and free their model copies;
+    call with models_lock held"""
+    global segment_pool
+    if segment_pool:
+        segment_pool["executor"].shutdown(wait=False)
+        logger.info(f"Retired {segment_pool['workers']} segment workers of model {segment_pool['model']}")
+        segment_pool = None
+
+def drop_broken_pool(executor):
+    """Forget a pool whose worker died (e.g. OOM-killed) so the next long file starts a fresh one"""
+    global segment_pool
+    with models_lock:
+        if segment_pool and segment_pool["executor"] is executor:
+            segment_pool = None
+            logger.error("A segment worker died; the pool will be restarted")
+
+def submit_segments(blocks, model_name):
+    """Queue segment decodes on worker processes for the model; returns the executor and the futures,
+    or None when fewer than two workers fit the memory budget (decode in this process instead)"""
+    global segment_pool
+    name = model_name or DEFAULT_MODEL
+    size = model_bytes(name)
+    with models_lock:
+        for attempt in range(2):
+            if segment_pool is None or segment_pool["model"] != name:
+                # Another model's workers go first (their queued segments still finish)
+                retire_segment_pool()
+                workers = SEGMENT_WORKERS
+                if MODEL_MEMORY_MB > 0:
+                    room = MODEL_MEMORY_MB * 1024 * 1024 - model_memory()
+                    workers = min(workers, int(room // size) if size else workers)
+                if workers < 2:
+                    return None
+                # Spawned workers keep their own registry and load the model on first use
+                segment_pool = {
+                    "executor": ProcessPoolExecutor(max_workers=workers,
+                                                    mp_context=multiprocessing.get_context("spawn")),
+                    "model": name, "workers": workers, "bytes": size,
+                }
+            # Submitted under the lock, so an eviction can't shut the pool down in between
+            executor = segment_pool["executor"]
+            try:
+                return executor, [executor.submit(decode_segment, *block) for block in blocks]
+            except BrokenProcessPool:
+                # A worker died after the last file: start a fresh pool
+                logger.error("A segment worker died; restarting the pool")
+                segment_pool = None
+        return None
+
+def transcribe_segments(wav_path, model_name=None, on_progress=None):
+    """Decode a wav into time-ordered segments, in parallel for long recordings.
+    on_progress receives a progress event for every piece of text as it is decoded."""
+    started = time.perf_counter()
+    with traced("read wav"), wave.open(wav_path, "rb") as wf:
+        rate = wf.getframerate()
+        pcm = wf.readframes(wf.getnframes())
+
+    duration = len(pcm) / 2 / rate
+
+    def report(text, words, start, end):
+        if on_progress and (text or end >= duration):
+            on_progress({
+                "event": "progress",
+                "start": round(start, 3),
+                "end": round(end, 3),
+                "text": text,
+                "words": words,
+                "progress": round(100.0 * end / duration, 1) if duration > 0 else 100.0,
+            })
+
+    submitted = None
+    if duration >= PARALLEL_MIN_SECONDS and SEGMENT_WORKERS > 1:
+        samples = np.frombuffer(pcm, dtype=np.int16)
+        with traced("find split points"):
+            bounds = [0] + find_split_points(samples, rate) + [len(samples)]
+        # Worker processes send their spans back with the segment
+        trace = getattr(job_trace, "events", None) is not None
+        blocks = [(pcm[a * 2:b * 2], rate, a / rate, model_name, None, trace) for a, b in zip(bounds, bounds[1:])]
+        submitted = submit_segments(blocks, model_name)
+
+    if submitted is None:
+        last_end = [0.0]
+
+        def on_result(text, words, position):
+            report(text, words, last_end[0], position)
+            last_end[0] = position
+
+        segments = [decode_segment(pcm, rate, 0.0, model_name, on_result if on_progress else None)]
+    else:
+        executor, futures = submitted
+        segments = []
+        # Segments are reported in order, each as soon as it and all before it are done
+        for block, future in zip(blocks, futures):
+            try:
+                segment = future.result()
+            except BrokenProcessPool:
+                # The rest of this file is decoded here; its spans go straight into this thread's trace
+                drop_broken_pool(executor)
+                segment = decode_segment(*block[:-1], trace=False)
+            if "trace" in segment:
+                job_trace.events.extend(segment.pop("trace"))
+            segments.append(segment)
+            report(segment["text"], segment["words"], segment["start"], segment["end"])
+
+    global expected_rtf
+    elapsed = time.perf_counter() - started
+    observe("transcriber_stage_seconds", elapsed, stage="transcribe")
+    trace_span("transcribe", started, elapsed, audio_seconds=round(duration, 3), segments=len(segments))
+    observe("transcriber_audio_duration_seconds", duration)
+    if duration > 0:
+        observe("transcriber_real_time_factor", elapsed / duration)
+        expected_rtf = 0.9 * expected_rtf + 0.1 * (elapsed / duration)
+    return segments
+
+def transcribe(wav_path, model_name=None):
+    segments = transcribe_segments(wav_path, model_name)
+    return " ".join(segment["text"] for segment in segments if segment["text"]).strip()
+
+def segment_summary(segments):
+    return [{"start": s["start"], "end": s["end"], "text": s["text"]} for s in segments]
+
+def wav_duration(wav_path):
+    with wave.open(wav_path, "rb") as wf:
+        return wf.getnframes() / float(wf.getframerate())
+
+def process_file(input_path, audio_id, model_name=None, on_progress=None):
+    """Convert, transcribe and save one file; runs on the scheduler's workers"""
+    job_trace.events = [] if TRACE_DIR else None
+    try:
+        with in_flight(), traced("process file", id=audio_id, model=model_name or DEFAULT_MODEL):
+            wav_path = os.path.join(UPLOAD_DIR, f"{audio_id}.wav")
+            if on_progress:
+                on_progress({"event": "status", "status": "converting"})
+            with timed("convert"):
+                convert_to_wav(input_path, wav_path)
+            if on_progress:
+                on_progress({"event": "status", "status": "transcribing"})
+            segments = transcribe_segments(wav_path, model_name, on_progress)
+            text = " ".join(segment["text"] for segment in segments if segment["text"])
+            txt_path = os.path.join(UPLOAD_DIR, f"{audio_id}.txt")
+            with timed("write"):
+                with open(txt_path, "w") as f:
+                    f.write(text)
+    finally:
+        events, job_trace.events = job_trace.events, None
+        if events:
+            try:
+                write_trace(audio_id, events)
+            except OSError as e:
+                logger.warning(f"Could not write trace for {audio_id}: {e}")
+    return {
+        "id": audio_id,
+        "transcription": text,
+        "duration": wav_duration(wav_path),
+        "segments": segment_summary(segments),
+        "words": [word for segment in segments for word in segment["words"]],
+    }
+
+def probe_duration(path):
+    """Audio length in seconds, read before conversion so work can be scheduled by cost"""
+    try:
+        return wav_duration(path)
+    except (wave.Error, EOFError):
+        pass
+    try:
+        output = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path],
+            capture_output=True, text=True, check=True, timeout=30,
+        ).stdout
+        return float(output.strip())
+    except (subprocess.SubprocessError, FileNotFoundError, ValueError):
+        # Unknown length; guess from size assuming 16-bit 16kHz mono
+        return os.path.getsize(path) / 32000.0
+
+class ScheduledWork:
+    __slots__ = ("fn", "args", "cost", "client", "priority", "queued", "future")
+
+    def __init__(self, fn, args, cost, client, priority):
+        self.fn = fn
+        self.args = args
+        self.cost = cost
+        self.client = client
+        self.priority = priority
+        self.queued = time.monotonic()
+        self.future = Future()
+
+class Scheduler:
+    """Runs transcription work on a fixed pool of worker threads, choosing the next item
+    by priority class, then the client that has received the least service, then the
+    shortest expected job (aged by its waiting time so long jobs still get their turn)."""
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.threads = []
+        self.queue = []
+        self.service = {}  # client -> expected seconds of work started for it
+        self.cond = threading.Condition()
+
+    def submit(self, fn, *args, duration=0.0, client="anonymous", priority="normal"):
+        with self.cond:
+            if not self.threads:
+                # Started on first use so spawned segment workers never run any
+                for i in range(self.workers):
+                    thread = threading.Thread(target=self.worker, name=f"transcribe-{i}", daemon=True)
+                    thread.start()
+                    self.threads.append(thread)
+            # A client that was idle does not get to bank service; it rejoins level with
+            # the least served client that has work waiting
+            waiting = [self.service[work.client] for work in self.queue]
+            floor = min(waiting) if waiting else max(self.service.values(), default=0.0)
+            self.service[client] = max(self.service.get(client, 0.0), floor)
+            work = ScheduledWork(fn, args, duration * expected_rtf, client, priority)
+            self.queue.append(work)
+            self.cond.notify()
+        return work.future
+
+    def next_work(self):
+        now = time.monotonic()
+        best_class = min(PRIORITY_CLASSES[work.priority] for work in self.queue)
+        candidates = [work for work in self.queue if PRIORITY_CLASSES[work.priority] == best_class]
+        client = min({work.client for work in candidates}, key=lambda c: self.service[c])
+        work = min(
+            (work for work in candidates if work.client == client),
+            key=lambda work: work.cost - (now - work.queued) * AGING_RATE,
+        )
+        self.queue.remove(work)
+        self.service[client] += work.cost
+        return work
+
+    def worker(self):
+        while True:
+            with self.cond:
+                while not self.queue:
+                    self.cond.wait()
+                work = self.next_work()
+            if not work.future.set_running_or_notify_cancel():
+                continue
+            try:
+                work.future.set_result(work.fn(*work.args))
+            except BaseException as e:
+                work.future.set_exception(e)
+
+    def queued_counts(self):
+        with self.cond:
+            counts = dict.fromkeys(PRIORITY_CLASSES, 0)
+            for work in self.queue:
+                counts[work.priority] += 1
+        return counts
+
+scheduler = Scheduler(TRANSCRIBE_WORKERS)
+
+def client_id(request, client=None):
+    """Who a request is for: explicit form field, X-Client-Id header, else the peer address"""
+    return client or request.headers.get("X-Client-Id") or (request.client.host if request.client else "anonymous")
+
+def unknown_priority_error(priority):
+    if priority not in PRIORITY_CLASSES:
+        return JSONResponse(status_code=400, content={"error": f"Unknown priority: {priority}"})
+    return None
+
+def resolve_batch_path(path):
+    """Map a client supplied path into BATCH_INPUT_DIR, or None if it escapes it"""
+    full_path = os.path.abspath(os.path.join(BATCH_INPUT_DIR, path))
+    try:
+        if os.path.commonpath([full_path, BATCH_INPUT_DIR]) != BATCH_INPUT_DIR:
+            return None
+    except ValueError:
+        return None
+    return full_path if os.path.isfile(full_path) else None
+
+def failure_message(e):
+    if isinstance(e, (subprocess.CalledProcessError, FileNotFoundError)):
+        return f"Conversion failed: {e}"
+    return f"Transcription failed: {e}"
+
+def format_event(event, stream_format):
+    if stream_format == "sse":
+        return f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+    return json.dumps(event) + "\n"
+
+async def stream_events(start_work, stream_format):
+    """Relay progress events of a scheduled transcription as they happen, then its result.
+    start_work(on_progress) must submit the work and return its future."""
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+
+    def on_progress(event):
+        loop.call_soon_threadsafe(events.put_nowait, event)
+
+    future = asyncio.wrap_future(start_work(on_progress))
+    yield format_event({"event": "status", "status": "queued"}, stream_format)
+
+    # Events are queued before the future resolves, so once it is done the queue is complete
+    while not future.done() or not events.empty():
+        getter = asyncio.ensure_future(events.get())
+        done, _ = await asyncio.wait({getter, future}, timeout=STREAM_HEARTBEAT_SECONDS,
+                                     return_when=asyncio.FIRST_COMPLETED)
+        if getter in done:
+            yield format_event(getter.result(), stream_format)
+            continue
+        getter.cancel()
+        if not done:
+            yield format_event({"event": "heartbeat"}, stream_format)
+
+    try:
+        result = future.result()
+    except Exception as e:
+        inc("transcriber_requests_total", endpoint="transcribe", status="error")
+        yield format_event({"event": "error", "error": failure_message(e)}, stream_format)
+        return
+    inc("transcriber_requests_total", endpoint="transcribe", status="ok")
+    yield format_event(dict(result, event="done"), stream_format)
 
 @app.post("/transcribe/")
-async def transcribe_audio(file: UploadFile = File(...)):
+async def transcribe_audio(request: Request, file: UploadFile = File(None), upload_id: str = Form(None),
+                           model: str = Form(None), client: str = Form(None), priority: str = Form("normal"),
+                           stream: str = Form(None)):
+    error = unknown_model_error(model) or unknown_priority_error(priority)
+    if error:
+        return error
+    if stream is None and "text/event-stream" in request.headers.get("accept", ""):
+        stream = "sse"
+    if stream is not None and stream not in STREAM_MEDIA_TYPES:
+        return JSONResponse(status_code=400, content={"error": f"Unknown stream format: {stream}"})
+    if file is None and not upload_id:
+        return JSONResponse(status_code=400, content={"error": "Send a file or an upload_id"})
+    error = disk_full_error() if file is not None else None
+    if error:
+        return error
+
     audio_id = str(uuid.uuid4())
-    input_path = os.path.join(UPLOAD_DIR, f"{audio_id}_{file.filename}")
-    with open(input_path, "wb") as f:
-        f.write(await file.read())
+    input_path = await receive_input(audio_id, file, upload_id)
+    if input_path is None:
+        return JSONResponse(status_code=400, content={"error": "Upload not found or incomplete"})
+
+    duration = await asyncio.to_thread(probe_duration, input_path)
+    requester = client_id(request, client)
 
-    wav_path = os.path.join(UPLOAD_DIR, f"{audio_id}.wav")
+    if stream:
+        def start_work(on_progress):
+            return scheduler.submit(process_file, input_path, audio_id, model, on_progress, duration=duration,
+                                    client=requester, priority=priority)
+        return StreamingResponse(stream_events(start_work, stream), media_type=STREAM_MEDIA_TYPES[stream])
+
+    future = scheduler.submit(process_file, input_path, audio_id, model, duration=duration,
+                              client=requester, priority=priority)
     try:
-        convert_to_wav(input_path, wav_path)
+        result = await asyncio.wrap_future(future)
     except Exception as e:
-        return JSONResponse(status_code=500, content={"error": f"Conversion failed: {e}"})
+        inc("transcriber_requests_total", endpoint="transcribe", status="error")
+        return JSONResponse(status_code=500, content={"error": failure_message(e)})
+
+    inc("transcriber_requests_total", endpoint="transcribe", status="ok")
+    return result
+
+def save_upload(upload, path):
+    """Copy a spooled upload to disk in pieces, so large batches never sit in memory whole"""
+    with open(path, "wb") as f:
+        shutil.copyfileobj(upload.file, f, 1024 * 1024)
+
+@app.post("/transcribe/batch")
+async def transcribe_batch(request: Request, files: List[UploadFile] = File(None), paths: List[str] = Form(None),
+                           model: str = Form(None), client: str = Form(None), priority: str = Form("low")):
+    error = unknown_model_error(model) or unknown_priority_error(priority)
+    if error:
+        return error
+
+    error = disk_full_error() if files else None
+    if error:
+        return error
+
+    # Collect (source name, input path, id); paths are checked before any upload is written,
+    # so a bad path doesn't leave orphaned files in uploads/
+    path_sources = []
+    for path in paths or []:
+        full_path = resolve_batch_path(path)
+        if full_path is None:
+            return JSONResponse(status_code=400, content={"error": f"Invalid path: {path}"})
+        path_sources.append((path, full_path, str(uuid.uuid4())))
+
+    if not files and not path_sources:
+        return JSONResponse(status_code=400, content={"error": "No files or paths given"})
+
+    sources = []
+    for upload in files or []:
+        audio_id = str(uuid.uuid4())
+        input_path = os.path.join(UPLOAD_DIR, f"{audio_id}_{upload.filename}")
+        with timed("write"):
+            await asyncio.to_thread(save_upload, upload, input_path)
+        sources.append((upload.filename, input_path, audio_id))
+    sources += path_sources
+
+    requester = client_id(request, client)
+
+    async def run(name, input_path, audio_id):
+        try:
+            duration = await asyncio.to_thread(probe_duration, input_path)
+            future = scheduler.submit(process_file, input_path, audio_id, model, duration=duration,
+                                      client=requester, priority=priority)
+            result = await asyncio.wrap_future(future)
+            inc("transcriber_requests_total", endpoint="batch", status="ok")
+        except Exception as e:
+            result = {"id": audio_id, "error": failure_message(e)}
+            inc("transcriber_requests_total", endpoint="batch", status="error")
+        result["source"] = name
+        return result
+
+    async def stream_results():
+        # One NDJSON line per file in completion order, then a throughput summary
+        started = time.perf_counter()
+        audio_seconds = 0.0
+        failed = 0
+        for next_result in asyncio.as_completed([run(*source) for source in sources]):
+            result = await next_result
+            if "error" in result:
+                failed += 1
+            audio_seconds += result.get("duration", 0.0)
+            yield json.dumps(result) + "\n"
+
+        wall_seconds = time.perf_counter() - started
+        yield json.dumps({"summary": {
+            "files": len(sources),
+            "failed": failed,
+            "audio_seconds": round(audio_seconds, 3),
+            "wall_seconds": round(wall_seconds, 3),
+            "throughput": round(audio_seconds / wall_seconds, 3) if wall_seconds > 0 else 0.0,
+        }}) + "\n"
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+def jobs_db():
+    conn = sqlite3.connect(JOBS_DB, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def init_jobs_db():
+    with closing(jobs_db()) as conn, conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                input_path TEXT NOT NULL,
+                callback_url TEXT,
+                model TEXT,
+                created REAL NOT NULL,
+                updated REAL NOT NULL,
+                result TEXT,
+                error TEXT
+            )
+        """)
+        # Columns added after the first release
+        columns = [row["name"] for row in conn.execute("PRAGMA table_info(jobs)")]
+        for column, kind in (("model", "TEXT"), ("client", "TEXT"), ("priority", "TEXT"), ("duration", "REAL")):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)")
+        # Jobs that were running when the server stopped go back to the queue
+        conn.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running'")
+
+def finish_job(job_id, status, result=None, error=None):
+    with closing(jobs_db()) as conn, conn:
+        conn.execute(
+            "UPDATE jobs SET status = ?, updated = ?, result = ?, error = ? WHERE id = ?",
+            (status, time.time(), json.dumps(result) if result is not None else None, error, job_id),
+        )
+
+def job_status(job_id):
+    with closing(jobs_db()) as conn:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None:
+        return None
+    status = {"id": row["id"], "status": row["status"], "created": row["created"], "updated": row["updated"]}
+    if row["status"] == "running":
+        status.update(job_progress.get(row["id"], {}))
+    if row["result"]:
+        status.update(json.loads(row["result"]))
+    if row["error"]:
+        status["error"] = row["error"]
+    return status
+
+def send_callback(callback_url, payload):
+    body = json.dumps(payload).encode("utf-8")
+    for attempt in range(CALLBACK_RETRIES):
+        try:
+            request = urllib.request.Request(
+                callback_url, data=body, headers={"Content-Type": "application/json"}, method="POST"
+            )
+            with urllib.request.urlopen(request, timeout=10):
+                return True
+        except Exception as e:
+            logger.warning(f"Callback to {callback_url} failed (attempt {attempt + 1}): {e}")
+            if attempt + 1 < CALLBACK_RETRIES:
+                time.sleep(2 ** attempt)
+    return False
+
+def schedule_job(job):
+    scheduler.submit(run_job, job, duration=job["duration"] or 0.0,
+                     client=job["client"] or "anonymous", priority=job["priority"] or "normal")
+
+def enqueue_queued_jobs():
+    """Hand every queued job to the scheduler, e.g. the ones left over from before a restart"""
+    with closing(jobs_db()) as conn:
+        rows = conn.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY created").fetchall()
+    for row in rows:
+        schedule_job(dict(row))
+
+def run_job(job):
+    # Another server process may have picked the job up already
+    with closing(jobs_db()) as conn, conn:
+        claimed = conn.execute(
+            "UPDATE jobs SET status = 'running', updated = ? WHERE id = ? AND status = 'queued'",
+            (time.time(), job["id"]),
+        ).rowcount
+    if not claimed:
+        return
+
+    # Pollers see the transcript grow while the job runs
+    texts = []
+
+    def on_progress(event):
+        if event["event"] == "progress":
+            if event["text"]:
+                texts.append(event["text"])
+            job_progress[job["id"]] = {"progress": event["progress"], "partial_transcription": " ".join(texts)}
 
     try:
-        text = transcribe(wav_path)
-        txt_path = os.path.join(UPLOAD_DIR, f"{audio_id}.txt")
-        with open(txt_path, "w") as f:
-            f.write(text)
+        result = process_file(job["input_path"], job["id"], job["model"], on_progress)
+        finish_job(job["id"], "done", result=result)
+        inc("transcriber_requests_total", endpoint="jobs", status="ok")
     except Exception as e:
-        return JSONResponse(status_code=500, content={"error": f"Transcription failed: {e}"})
+        inc("transcriber_requests_total", endpoint="jobs", status="error")
+        logger.error(f"Job {job['id']} failed: {e}")
+        finish_job(job["id"], "failed", error=failure_message(e))
+    finally:
+        job_progress.pop(job["id"], None)
+
+    if job["callback_url"]:
+        callback_executor.submit(send_callback, job["callback_url"], job_status(job["id"]))
+
+def u8_to_s16(block):
+    # The Arduino sends unsigned 8-bit samples; the recognizer wants signed 16-bit
+    return ((np.frombuffer(block, dtype=np.uint8).astype(np.int16) - 128) << 8).tobytes()
+
+class LocalTranscriptionHandler(socketserver.StreamRequestHandler):
+    """One recording per connection: a JSON header line, then PCM blocks each prefixed
+    with a 4-byte big-endian length; an empty block ends the stream and the result is
+    sent back as one JSON line. Decoding runs on the scheduler's workers like all other
+    transcription work, at "high" priority unless the header asks otherwise, so a live
+    recording keeps up with queued files."""
+
+    def handle(self):
+        with in_flight():
+            try:
+                reply = self.transcribe_stream()
+                inc("transcriber_requests_total", endpoint="local", status="ok")
+            except ConnectionError:
+                # Client went away before ending the stream; nobody to answer
+                inc("transcriber_requests_total", endpoint="local", status="error")
+                return
+            except Exception as e:
+                inc("transcriber_requests_total", endpoint="local", status="error")
+                reply = {"error": f"Transcription failed: {e}"}
+        self.wfile.write(json.dumps(reply).encode("utf-8") + b"\n")
+
+    def read_exactly(self, size):
+        data = self.rfile.read(size)
+        if len(data) < size:
+            raise ConnectionError("Stream ended early")
+        return data
+
+    def decode(self, data, final=False):
+        """Feed audio to the recognizer on a scheduler worker; returns the recognizer results"""
+        def run():
+            results = []
+            if data and self.rec.AcceptWaveform(data):
+                results.append(self.rec.Result())
+            if final:
+                results.append(self.rec.FinalResult())
+            return results
+        return scheduler.submit(run, duration=len(data) / 2 / self.rate, client=self.client,
+                                priority=self.priority).result()
+
+    def transcribe_stream(self):
+        header = json.loads(self.rfile.readline() or b"{}")
+        self.rate = int(header.get("rate", 16000))
+        sample_width = int(header.get("sample_width", 2))
+        self.client = header.get("client") or "local"
+        self.priority = header.get("priority", "high")
+        if self.priority not in PRIORITY_CLASSES:
+            raise ValueError(f"Unknown priority: {self.priority}")
+        model = get_model(header.get("model"))
+        self.rec = KaldiRecognizer(model, self.rate)
+        self.rec.SetWords(True)
+        texts = []
+        words = []
+        pending = []  # Blocks not yet decoded, joined once per full read
+        pending_bytes = 0
+        samples = 0
+        step = READ_FRAMES * sample_width
+
+        while True:
+            (size,) = struct.unpack(">I", self.read_exactly(4))
+            if size == 0:
+                break
+            block = self.read_exactly(size)
+            samples += len(block) // sample_width
+            # Blocks arrive at serial-read granularity; feed the recognizer in full reads.
+            # Vosk only takes bytes, so a block that fills a read on its own is passed as is.
+            pending.append(block)
+            pending_bytes += len(block)
+            if pending_bytes >= step:
+                data = pending[0] if len(pending) == 1 else b"".join(pending)
+                pending.clear()
+                pending_bytes = 0
+                for result in self.decode(u8_to_s16(data) if sample_width == 1 else data):
+                    collect_result(result, 0.0, texts, words)
+
+        started = time.perf_counter()
+        data = b"".join(pending)
+        for result in self.decode(u8_to_s16(data) if sample_width == 1 else data, final=True):
+            collect_result(result, 0.0, texts, words)
+        observe("transcriber_stage_seconds", time.perf_counter() - started, stage="transcribe")
+        duration = samples / self.rate
+        observe("transcriber_audio_duration_seconds", duration)
+        text = " ".join(texts)
+        return {
+            "transcription": text,
+            "duration": duration,
+            "segments": [{"start": 0.0, "end": round(duration, 3), "text": text}],
+            "words": words,
+        }
+
+def start_local_socket():
+    if not LOCAL_SOCKET_PATH or not hasattr(socket, "AF_UNIX"):
+        return
+    try:
+        if os.path.lexists(LOCAL_SOCKET_PATH):
+            # Only replace a stale socket of our own (a previous run); never whatever else is there
+            existing = os.lstat(LOCAL_SOCKET_PATH)
+            if not stat.S_ISSOCK(existing.st_mode) or existing.st_uid != os.getuid():
+                logger.error(f"Local socket {LOCAL_SOCKET_PATH} not started: the path exists and is not our socket")
+                return
+            os.remove(LOCAL_SOCKET_PATH)
+        # Created owner-only from the start, so nobody else can connect before a chmod
+        umask = os.umask(0o077)
+        try:
+            server = socketserver.ThreadingUnixStreamServer(LOCAL_SOCKET_PATH, LocalTranscriptionHandler)
+        finally:
+            os.umask(umask)
+    except OSError as e:
+        logger.error(f"Local socket {LOCAL_SOCKET_PATH} unavailable: {e}")
+        return
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="local-socket", daemon=True).start()
+    logger.info(f"Local transcription socket listening on {LOCAL_SOCKET_PATH}")
+
+def free_disk_mb():
+    return shutil.disk_usage(UPLOAD_DIR).free / 2**20
+
+def upload_groups():
+    """Files in uploads/ grouped by the request, job or upload id their names start with"""
+    groups = {}
+    for entry in os.scandir(UPLOAD_DIR):
+        try:
+            uuid.UUID(entry.name[:36])
+        except ValueError:
+            continue
+        if entry.is_file():
+            groups.setdefault(entry.name[:36], []).append(entry)
+    return groups
+
+def sweep_uploads(urgent=False):
+    """Delete the files of expired work, and under disk pressure (urgent) of finished work, oldest first.
+    Files of queued and running jobs are always kept. Returns (files deleted, bytes freed)."""
+    with closing(jobs_db()) as conn:
+        active = conn.execute("SELECT id, input_path FROM jobs WHERE status IN ('queued', 'running')").fetchall()
+        finished_inputs = {os.path.abspath(row[0]) for row in conn.execute(
+            "SELECT input_path FROM jobs WHERE status IN ('done', 'failed')")} if urgent else set()
+    active_ids = {row["id"] for row in active}
+    active_inputs = {os.path.abspath(row["input_path"]) for row in active}
+
+    now = time.time()
+    candidates = []
+    for group_id, entries in upload_groups().items():
+        paths = {os.path.abspath(entry.path) for entry in entries}
+        if group_id in active_ids or paths & active_inputs:
+            continue
+        newest = max(entry.stat().st_mtime for entry in entries)
+        expired = UPLOAD_RETENTION_HOURS > 0 and now - newest > UPLOAD_RETENTION_HOURS * 3600
+        # A transcript means the work is done; a job's resumable upload is done when its job is
+        finished = any(entry.name.endswith(".txt") for entry in entries) or bool(paths & finished_inputs)
+        if expired or (urgent and finished):
+            candidates.append((newest, expired, entries))
+
+    deleted = freed = 0
+    for newest, expired, entries in sorted(candidates, key=lambda candidate: candidate[0]):
+        if not expired and free_disk_mb() >= MIN_FREE_DISK_MB:
+            break
+        for entry in entries:
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            deleted += 1
+            freed += size
+    if freed:
+        inc("transcriber_swept_bytes_total", freed)
+    return deleted, freed
+
+def upload_sweeper():
+    """Apply the uploads/ retention now and every SWEEP_INTERVAL, or as soon as disk space runs low"""
+    while True:
+        try:
+            urgent = free_disk_mb() < MIN_FREE_DISK_MB
+            deleted, freed = sweep_uploads(urgent)
+            if deleted:
+                logger.info(f"Swept {deleted} files ({freed / 2**20:.1f} MB) from {UPLOAD_DIR}")
+            if free_disk_mb() < MIN_FREE_DISK_MB:
+                logger.warning(f"Only {free_disk_mb():.0f} MB free; refusing new uploads until space frees up")
+            set_gauge("transcriber_disk_free_bytes", shutil.disk_usage(UPLOAD_DIR).free)
+        except Exception as e:
+            logger.error(f"Upload sweep failed: {e}")
+        sweep_requested.wait(SWEEP_INTERVAL)
+        sweep_requested.clear()
+
+def disk_full_error():
+    """507 while free space is below the watermark, so queued and running jobs keep the room they need"""
+    if free_disk_mb() >= MIN_FREE_DISK_MB:
+        return None
+    sweep_requested.set()
+    return JSONResponse(status_code=507, headers={"Retry-After": "60"},
+                        content={"error": "Server is low on disk space, try again later"})
+
+def preload_models(names):
+    for name in names:
+        try:
+            get_model(name)
+        except Exception as e:
+            logger.error(f"Preloading model {name} failed: {e}")
+
+@app.on_event("startup")
+def startup():
+    budget = f"{MODEL_MEMORY_MB:.0f} MB" if MODEL_MEMORY_MB > 0 else "no limit"
+    logger.info(f"Model memory budget: {budget}, up to {SEGMENT_WORKERS} segment workers per long file")
+    init_jobs_db()
+    enqueue_queued_jobs()
+
+    # Warm models in the background so startup never waits on a model load
+    preload = [name.strip() for name in os.getenv("PRELOAD_MODELS", "").split(",") if name.strip()]
+    if preload:
+        threading.Thread(target=preload_models, args=(preload,), name="model-preload", daemon=True).start()
+
+    start_local_socket()
+    threading.Thread(target=upload_sweeper, name="upload-sweeper", daemon=True).start()
+
+@app.get("/")
+@app.get("/health")
+def health():
+    with models_lock:
+        loaded = list(loaded_models)
+    return {"status": "ok", "default_model": DEFAULT_MODEL, "loaded_models": loaded}
+
+@app.get("/models")
+def list_models():
+    with models_lock:
+        loaded = dict(loaded_models)
+        memory = model_memory()
+        pool = dict(segment_pool) if segment_pool else {}
+    return {
+        "default": DEFAULT_MODEL,
+        "memory_budget_mb": MODEL_MEMORY_MB,
+        "memory_used_mb": round(memory / 1024 / 1024, 1),
+        "models": [
+            {"name": name, "path": path, "loaded": name in loaded,
+             "size_mb": round(loaded[name][1] / 1024 / 1024, 1) if name in loaded else None,
+             "segment_workers": pool["workers"] if pool.get("model") == name else 0}
+            for name, path in model_paths().items()
+        ],
+    }
+
+def upload_info(upload_id):
+    """Return the metadata of a resumable upload plus its current offset, or None"""
+    try:
+        upload_id = str(uuid.UUID(upload_id))
+    except ValueError:
+        return None
+    meta_path = os.path.join(UPLOAD_DIR, f"{upload_id}.upload.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        info = json.load(f)
+    info["offset"] = os.path.getsize(info["path"])
+    info["complete"] = info["offset"] == info["size"]
+    return info
+
+@app.post("/uploads", status_code=201)
+def create_upload(filename: str = Form(...), size: int = Form(...)):
+    if size < 0:
+        return JSONResponse(status_code=400, content={"error": "size must not be negative"})
+    error = disk_full_error()
+    if error:
+        return error
+    upload_id = str(uuid.uuid4())
+    path = os.path.join(UPLOAD_DIR, f"{upload_id}_{os.path.basename(filename)}")
+    open(path, "wb").close()
+    with open(os.path.join(UPLOAD_DIR, f"{upload_id}.upload.json"), "w") as f:
+        json.dump({"id": upload_id, "filename": os.path.basename(filename), "size": size, "path": path}, f)
+    return {"id": upload_id, "offset": 0}
+
+@app.get("/uploads/{upload_id}")
+def get_upload(upload_id: str):
+    info = upload_info(upload_id)
+    if info is None:
+        return JSONResponse(status_code=404, content={"error": "Upload not found"})
+    return {"id": info["id"], "offset": info["offset"], "size": info["size"], "complete": info["complete"]}
+
+@app.put("/uploads/{upload_id}")
+async def append_upload(upload_id: str, offset: int, request: Request):
+    info = upload_info(upload_id)
+    if info is None:
+        return JSONResponse(status_code=404, content={"error": "Upload not found"})
+    # A chunk must start exactly where the stored data ends; otherwise tell the client where
+    if offset != info["offset"]:
+        return JSONResponse(status_code=409, content={"error": "Offset mismatch", "offset": info["offset"]})
+    error = disk_full_error()
+    if error:
+        return error
+
+    # Enforce the limit before buffering: by the declared length, then as the body streams in
+    limit = min(MAX_UPLOAD_CHUNK, info["size"] - offset)
+    too_large = JSONResponse(status_code=413, content={"error": "Chunk too large", "offset": info["offset"]})
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > limit:
+        return too_large
+    data = bytearray()
+    async for piece in request.stream():
+        data += piece
+        if len(data) > limit:
+            return too_large
+
+    lock = upload_locks.setdefault(info["id"], asyncio.Lock())
+    async with lock:
+        # Another PUT at the same offset (a retry after a timeout) may have landed while this body arrived
+        stored = os.path.getsize(info["path"])
+        if stored != offset:
+            return JSONResponse(status_code=409, content={"error": "Offset mismatch", "offset": stored})
+        with timed("write"):
+            with open(info["path"], "r+b") as f:
+                f.seek(offset)
+                f.write(data)
+    new_offset = offset + len(data)
+    if new_offset == info["size"]:
+        upload_locks.pop(info["id"], None)
+    return {"id": info["id"], "offset": new_offset, "complete": new_offset == info["size"]}
+
+async def receive_input(audio_id, file, upload_id):
+    """Store a multipart upload, or look up a completed resumable one; returns its path"""
+    if upload_id:
+        info = upload_info(upload_id)
+        if info is None or not info["complete"]:
+            return None
+        return info["path"]
+
+    input_path = os.path.join(UPLOAD_DIR, f"{audio_id}_{file.filename}")
+    with timed("write"):
+        data = await file.read()
+        with open(input_path, "wb") as f:
+            f.write(data)
+    return input_path
+
+@app.post("/jobs", status_code=202)
+async def create_job(request: Request, file: UploadFile = File(None), upload_id: str = Form(None),
+                     callback_url: str = Form(None), model: str = Form(None), client: str = Form(None),
+                     priority: str = Form("normal")):
+    error = unknown_model_error(model) or unknown_priority_error(priority)
+    if error:
+        return error
+    if callback_url and not callback_url.startswith(("http://", "https://")):
+        return JSONResponse(status_code=400, content={"error": "callback_url must be an http(s) URL"})
+    if file is None and not upload_id:
+        return JSONResponse(status_code=400, content={"error": "Send a file or an upload_id"})
+    error = disk_full_error() if file is not None else None
+    if error:
+        return error
+
+    job_id = str(uuid.uuid4())
+    input_path = await receive_input(job_id, file, upload_id)
+    if input_path is None:
+        return JSONResponse(status_code=400, content={"error": "Upload not found or incomplete"})
+
+    now = time.time()
+    job = {
+        "id": job_id, "input_path": input_path, "callback_url": callback_url, "model": model,
+        "client": client_id(request, client), "priority": priority,
+        "duration": await asyncio.to_thread(probe_duration, input_path),
+    }
+    with closing(jobs_db()) as conn, conn:
+        conn.execute(
+            "INSERT INTO jobs (id, status, input_path, callback_url, model, client, priority, duration, created, updated) "
+            "VALUES (:id, 'queued', :input_path, :callback_url, :model, :client, :priority, :duration, :now, :now)",
+            dict(job, now=now),
+        )
+    schedule_job(job)
+    return {"id": job_id, "status": "queued"}
 
-    return {"id": audio_id, "transcription": text}
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    status = job_status(job_id)
+    if status is None:
+        return JSONResponse(status_code=404, content={"error": "Job not found"})
+    return status
 
+@app.get("/metrics")
+def metrics():
+    # Gauges that are cheaper to read at scrape time than to keep updated
+    for priority, count in scheduler.queued_counts().items():
+        set_gauge("transcriber_queued", count, priority=priority)
+    with models_lock:
+        set_gauge("transcriber_models_loaded", len(loaded_models))
+        set_gauge("transcriber_model_memory_bytes", model_memory())
+        set_gauge("transcriber_segment_workers", segment_pool["workers"] if segment_pool else 0)
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,18 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture(scope="session")
+def main(tmp_path_factory):
+    """app.main, imported from a scratch directory so its uploads/ folder lands there. No model is
+    loaded until something is transcribed."""
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("server"))
+    try:
+        return importlib.import_module("app.main")
+    finally:
+        os.chdir(cwd)
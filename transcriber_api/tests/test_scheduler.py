@@ -0,0 +1,49 @@
+import threading
+
+import pytest
+
+@pytest.fixture
+def scheduler(main, monkeypatch):
+    monkeypatch.setattr(main, "expected_rtf", 1.0)
+    return main.Scheduler(1)
+
+def run(scheduler, jobs):
+    """Queue (name, client, priority, seconds) jobs behind a blocked worker, then release it and
+    return the names in the order they ran"""
+    order = []
+    started, release = threading.Event(), threading.Event()
+    scheduler.submit(lambda: (started.set(), release.wait()), client="blocker", priority="high")
+    assert started.wait(5)
+    futures = [scheduler.submit(order.append, name, duration=seconds, client=client, priority=priority)
+               for name, client, priority, seconds in jobs]
+    release.set()
+    for future in futures:
+        future.result(timeout=5)
+    return order
+
+def test_priority_class_then_shortest_job(scheduler):
+    order = run(scheduler, [
+        ("low", "a", "low", 1),
+        ("normal-30", "a", "normal", 30),
+        ("normal-10", "a", "normal", 10),
+        ("high", "a", "high", 60),
+        ("normal-20", "a", "normal", 20),
+    ])
+    assert order == ["high", "normal-10", "normal-20", "normal-30", "low"]
+
+def test_clients_share_the_workers(scheduler):
+    order = run(scheduler, [(f"a{i}", "a", "normal", 10) for i in range(4)]
+                + [(f"b{i}", "b", "normal", 10) for i in range(2)])
+    clients = [name[0] for name in order]
+    assert sorted(clients[:4]) == ["a", "a", "b", "b"]
+    assert all(x != y for x, y in zip(clients[:4], clients[1:4]))
+    assert clients[4:] == ["a", "a"]
+
+def test_idle_client_does_not_bank_service(scheduler):
+    run(scheduler, [("b0", "b", "normal", 0)])
+    run(scheduler, [(f"a{i}", "a", "normal", 10) for i in range(3)])
+    # b was idle while a used 30 seconds; it rejoins level instead of owning the next three turns
+    order = run(scheduler, [(f"a{i}", "a", "normal", 10) for i in range(3)]
+                + [(f"b{i}", "b", "normal", 10) for i in range(3)])
+    clients = [name[0] for name in order]
+    assert all(x != y for x, y in zip(clients, clients[1:]))
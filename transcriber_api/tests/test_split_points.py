@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+RATE = 16000
+
+@pytest.fixture(autouse=True)
+def segment_length(main, monkeypatch):
+    monkeypatch.setattr(main, "SEGMENT_TARGET_SECONDS", 30.0)
+
+def audio(*parts):
+    """Concatenate ("speech" | "silence", seconds) parts into 16-bit samples"""
+    rng = np.random.default_rng(0)
+    return np.concatenate([
+        rng.normal(0, 3000, int(RATE * seconds)).astype(np.int16) if kind == "speech"
+        else np.zeros(int(RATE * seconds), np.int16)
+        for kind, seconds in parts
+    ])
+
+def test_cuts_in_the_middle_of_gaps_past_the_target(main):
+    samples = audio(("speech", 10), ("silence", 0.5), ("speech", 30), ("silence", 0.1), ("speech", 5),
+                    ("silence", 0.5), ("speech", 40), ("silence", 0.5), ("speech", 10))
+    cuts = main.find_split_points(samples, RATE)
+    # The gap at 10s comes before the target and the 0.1s one is too short to count
+    assert [round(cut / RATE, 2) for cut in cuts] == [45.85, 86.35]
+    assert all(not samples[cut - RATE // 10:cut + RATE // 10].any() for cut in cuts)
+
+def test_forces_cuts_when_there_is_no_silence(main):
+    cuts = main.find_split_points(audio(("speech", 150)), RATE)
+    assert cuts == [60 * RATE, 120 * RATE]
+
+def test_no_cut_in_trailing_silence(main):
+    assert main.find_split_points(audio(("speech", 40), ("silence", 0.4)), RATE) == []
+    assert main.find_split_points(np.zeros(10, np.int16), RATE) == []
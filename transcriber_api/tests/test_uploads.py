@@ -0,0 +1,30 @@
+import asyncio
+
+import httpx
+
+def test_concurrent_chunks_at_one_offset_append_once(main, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / main.UPLOAD_DIR).mkdir()
+
+    async def chunk(data):
+        for i in range(len(data)):
+            await asyncio.sleep(0.02)
+            yield data[i:i + 1]
+
+    async def upload():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            upload_id = (await client.post("/uploads", data={"filename": "a.wav", "size": "8"})).json()["id"]
+            # A client retrying after a timeout sends the same offset while the first PUT is still arriving
+            first, retry = await asyncio.gather(
+                client.put(f"/uploads/{upload_id}", params={"offset": 0}, content=chunk(b"AAAA")),
+                client.put(f"/uploads/{upload_id}", params={"offset": 0}, content=chunk(b"BBBB")),
+            )
+            last = await client.put(f"/uploads/{upload_id}", params={"offset": 4}, content=b"CCCC")
+            return upload_id, sorted([first.status_code, retry.status_code]), last.json()
+
+    upload_id, statuses, last = asyncio.run(upload())
+    assert statuses == [200, 409]
+    assert last["offset"] == 8 and last["complete"]
+    data = open(main.upload_info(upload_id)["path"], "rb").read()
+    assert data in (b"AAAACCCC", b"BBBBCCCC")